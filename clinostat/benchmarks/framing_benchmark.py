@@ -0,0 +1,85 @@
+"""
+Microbenchmark of I2C packet framing.
+
+Compares the original list-concatenation framing with the bit-by-bit CRC
+against the table-driven CRC and the preallocated PacketBuilder.
+
+Run from the clinostat directory:
+    python -m benchmarks.framing_benchmark
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.framing_utils import PacketBuilder, calculate_crc16, encode_motor_state
+
+def calculate_crc16_bitwise(data):
+    """
+    The original bit-by-bit CRC-CCITT implementation from comms_utils.
+    """
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = (crc << 1) ^ 0x1021
+            else:
+                crc <<= 1
+            crc &= 0xFFFF
+    return crc
+
+def build_packet_original(command, payload):
+    """
+    The original framing from send_i2c_command.
+    """
+    packet = [0xFF, len(payload) + 1, command] + payload
+    crc = calculate_crc16_bitwise(packet)
+    packet.append((crc >> 8) & 0xFF)
+    packet.append(crc & 0xFF)
+    return packet
+
+def motor_payload_original(frame_sps, core_sps):
+    """
+    The original 0x01 payload construction from motor_control.set_motor_speed.
+    """
+    frame_sps_bytes = [
+        (int(frame_sps * 1000) >> 16) & 0xFF,
+        (int(frame_sps * 1000) >> 8) & 0xFF,
+        int(frame_sps * 1000) & 0xFF,
+    ]
+    core_sps_bytes = [
+        (int(core_sps * 1000) >> 16) & 0xFF,
+        (int(core_sps * 1000) >> 8) & 0xFF,
+        int(core_sps * 1000) & 0xFF,
+    ]
+    return [1] + frame_sps_bytes + [4, 1, 1] + core_sps_bytes + [3, 0]
+
+def main(iterations=20000):
+    motor_payload = motor_payload_original(533.333, 266.667)
+    led_batch = [1] + [1, 90, 255, 0, 0, 0, 255] * 3
+    uart_line = b"HANDSHAKE_RESPONSE,SSID=clinostat,PASSWORD=clinostat"
+
+    assert calculate_crc16(uart_line) == calculate_crc16_bitwise(uart_line)
+    assert calculate_crc16(uart_line[20:], calculate_crc16(uart_line[:20])) == calculate_crc16_bitwise(uart_line)
+    builder = PacketBuilder()
+    assert bytes(builder.build(0x06, led_batch)) == bytes(build_packet_original(0x06, led_batch))
+
+    cases = [
+        ("motor packet (original)", lambda: build_packet_original(0x01, motor_payload_original(533.333, 266.667))),
+        ("motor packet (builder)", lambda: builder.build(0x01, encode_motor_state(1, 533.333, 16, 1) + encode_motor_state(1, 266.667, 8, 0))),
+        ("LED batch packet (original)", lambda: build_packet_original(0x06, led_batch)),
+        ("LED batch packet (builder)", lambda: builder.build(0x06, led_batch)),
+        ("UART line CRC (original)", lambda: calculate_crc16_bitwise(uart_line)),
+        ("UART line CRC (table)", lambda: calculate_crc16(uart_line)),
+    ]
+    assert bytes(cases[1][1]()) == bytes(build_packet_original(0x01, motor_payload))
+
+    print(f"{'case':<32}{'us per packet':>16}")
+    for name, case in cases:
+        seconds = min(timeit.repeat(case, number=iterations, repeat=5))
+        print(f"{name:<32}{seconds / iterations * 1e6:>16.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@ from PyQt5.QtWidgets import QMainWindow, QApplication, QFileDialog, QMessageBox
 from PyQt5.QtCore import pyqtSignal
 from src.ui.source import clinostat_ui
 from src.utils.startup import startup  # Import startup function
-from src.utils.general_utils import open_file_dialog  # Import utility functions
+from src.utils.general_utils import open_file_dialog, flush_dynamic_config  # Import utility functions
 import src.ui.handler.lighting_ui_handler as lighting_ui_handlers  # Import lighting UI handlers
 import src.ui.handler.motion_ui_handler as motion_ui_handlers  # Import motion UI handlers
 import src.ui.handler.core_ui_handler as core_ui_handlers  # Import core UI handlers
@@ -30,6 +30,7 @@ class MainWindow(QMainWindow, clinostat_ui.Ui_MainWindow):
     ambient_sensor_error = pyqtSignal()     # Define the custom signal for ambient sensor error
     image_capture_error = pyqtSignal()      # Define the custom signal for image capture error
     fan_control_timeout = pyqtSignal()      # Define the custom signal for fan control timeout
+    i2c_communication_error = pyqtSignal()  # Define the custom signal for I2C communication errors
 
 
     def __init__(self):
@@ -91,10 +92,10 @@ class MainWindow(QMainWindow, clinostat_ui.Ui_MainWindow):
         # Lighting control signals
         self.lighting_LED_confirm_pushButton.clicked.connect(lambda: lighting_ui_handlers.LED_confirmed(self))
         self.lighting_LED_reset_pushButton.clicked.connect(lambda: lighting_ui_handlers.LED_reset(self))
-        self.lighting_save_preset_1_pushButton.clicked.connect(lambda: lighting_ui_handlers.save_preset(1))
-        self.lighting_save_preset_2_pushButton.clicked.connect(lambda: lighting_ui_handlers.save_preset(2))
-        self.lighting_load_preset_1_pushButton.clicked.connect(lambda: load_preset(1))
-        self.lighting_load_preset_2_pushButton.clicked.connect(lambda: load_preset(2))
+        self.lighting_save_preset_1_pushButton.clicked.connect(lambda: lighting_ui_handlers.save_preset("preset_1"))
+        self.lighting_save_preset_2_pushButton.clicked.connect(lambda: lighting_ui_handlers.save_preset("preset_2"))
+        self.lighting_load_preset_1_pushButton.clicked.connect(lambda: load_preset("preset_1"))
+        self.lighting_load_preset_2_pushButton.clicked.connect(lambda: load_preset("preset_2"))
         self.lighting_core_fan_speed_horizontalSlider.valueChanged.connect(
             lambda value: core_ui_handlers.fan_speed_changed(self, value)
         )
@@ -210,13 +211,16 @@ class MainWindow(QMainWindow, clinostat_ui.Ui_MainWindow):
         # Connect the custom signal to the error handler
         self.image_capture_error.connect(lambda: general_ui_updater.display_image(self, image_path="/home/pi/Documents/clinostat/src/assets/images/camera_error.png"))
         self.fan_control_timeout.connect(lambda: general_ui_updater.display_image(self, image_path="/home/pi/Documents/clinostat/src/assets/images/core_error.png"))
+        self.i2c_communication_error.connect(lambda: general_ui_updater.show_communication_error(self))
 
     def run_update_script(self):
+        flush_dynamic_config()
         result = subprocess.run(["sudo", "python3", "/home/pi/Documents/clinostat/update.py"], check=True)
         if result.returncode == 0:
             self.close()
 
     def run_factory_reset(self):
+        flush_dynamic_config()
         result = subprocess.run(["sudo", "python3", "/home/pi/Documents/clinostat/update.py", "/home/pi/Documents/backups/clinostat.zip"], check=True)
         if result.returncode == 0:
             self.close()
@@ -226,6 +230,7 @@ class MainWindow(QMainWindow, clinostat_ui.Ui_MainWindow):
 
 def main():
     app = QApplication(sys.argv)
+    app.aboutToQuit.connect(flush_dynamic_config)  # Write pending configuration changes on exit
     main_window = MainWindow()
     main_window.show()
     sys.exit(app.exec_())
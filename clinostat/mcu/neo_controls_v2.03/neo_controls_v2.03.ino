@@ -27,6 +27,19 @@
 #define PACKET_MAX_SIZE 32
 #define START_BYTE 0xFF
 
+#define LED_SEGMENT_SIZE 7
+#define LED_BATCH_FLAG_DISPLAY 0x01
+
+// Status byte sent on I2C read requests: busy flag, 3-bit error code, 4-bit sequence number
+#define STATUS_BUSY 0x80
+#define ERROR_NONE 0
+#define ERROR_PACKET_TOO_SHORT 1
+#define ERROR_PACKET_TOO_LONG 2
+#define ERROR_INVALID_START_BYTE 3
+#define ERROR_LENGTH_MISMATCH 4
+#define ERROR_CRC_MISMATCH 5
+#define ERROR_UNKNOWN_COMMAND 6
+
 TMC2208Stepper core_driver = TMC2208Stepper(&Serial1);
 AccelStepper core_stepper = AccelStepper(core_stepper.DRIVER, STEP_PIN_CORE, DIR_PIN_CORE);
 
@@ -36,7 +49,10 @@ AccelStepper frame_stepper = AccelStepper(frame_stepper.DRIVER, STEP_PIN_FRAME,
 Adafruit_NeoPixel strip = Adafruit_NeoPixel(NUM_LEDS, LED_PIN, NEO_GRBW + NEO_KHZ800);
 
 uint8_t packet[PACKET_MAX_SIZE];
-boolean ms_change = false;
+volatile boolean ms_change = false;
+
+volatile uint8_t status_sequence = 0;
+volatile uint8_t status_error = ERROR_NONE;
 
 uint8_t frame_microstepping;
 uint8_t core_microstepping;
@@ -67,6 +83,7 @@ void setup() {
     initMotors();
     Wire.begin(SLAVE_ADDRESS);
     Wire.onReceive(receivePacket);
+    Wire.onRequest(sendStatus);
     Wire.setWireTimeout(1000, true);
     startupSequence();
 }
@@ -128,8 +145,17 @@ void startupSequence() {
 void receivePacket(int byteCount) {
     bool timeout = false;
     digitalWrite(BUZZER_PIN, HIGH);
+    uint8_t error = ERROR_NONE;
     if (byteCount < 5) {
         Serial.println("Error: Packet too short");
+        error = ERROR_PACKET_TOO_SHORT;
+        timeout = true;
+    } else if (byteCount > PACKET_MAX_SIZE) {
+        Serial.println("Error: Packet too long");
+        while (Wire.available()) {
+            Wire.read();
+        }
+        error = ERROR_PACKET_TOO_LONG;
         timeout = true;
     } else {
         for (int i = 0; i < byteCount; i++) {
@@ -138,12 +164,14 @@ void receivePacket(int byteCount) {
 
         if (packet[0] != START_BYTE) {
             Serial.println("Error: Invalid start byte");
+            error = ERROR_INVALID_START_BYTE;
             timeout = true;
         } else {
             uint8_t length = packet[1];
 
             if (length != (byteCount - 4)) {
                 Serial.println("Error: Length mismatch");
+                error = ERROR_LENGTH_MISMATCH;
                 timeout = true;
             } else {
                 uint16_t computedCRC = calculateCRC16(packet, byteCount - 2);
@@ -151,13 +179,16 @@ void receivePacket(int byteCount) {
 
                 if (computedCRC != receivedCRC) {
                     Serial.println("Error: CRC mismatch");
+                    error = ERROR_CRC_MISMATCH;
                     timeout = true;
-                } else {
-                    processCommand(packet[2], &packet[3], length - 1);
+                } else if (!processCommand(packet[2], &packet[3], length - 1)) {
+                    error = ERROR_UNKNOWN_COMMAND;
                 }
             }
         }
     }
+    status_error = error;
+    status_sequence = (status_sequence + 1) & 0x0F;
     digitalWrite(BUZZER_PIN, LOW);
     if (timeout) {
         // Handle timeout or error case
@@ -166,7 +197,13 @@ void receivePacket(int byteCount) {
     }
 }
 
-void processCommand(uint8_t command, uint8_t *data, uint8_t dataLength) {
+void sendStatus() {
+    // The deferred microstepping update in loop() is reported as busy
+    uint8_t status = (ms_change ? STATUS_BUSY : 0) | ((status_error & 0x07) << 4) | (status_sequence & 0x0F);
+    Wire.write(status);
+}
+
+bool processCommand(uint8_t command, uint8_t *data, uint8_t dataLength) {
     Serial.print("Processing command: ");
     Serial.println(command, HEX);
 
@@ -189,9 +226,13 @@ void processCommand(uint8_t command, uint8_t *data, uint8_t dataLength) {
         case 0x05:
             activateBuzzer(data, dataLength);
             break;
-        default:
+        case 0x06:
+            setLEDSegments(data, dataLength);
             break;
+        default:
+            return false;
     }
+    return true;
 }
 
 void resetArduino() {
@@ -284,6 +325,18 @@ void setLEDColors(uint8_t *data, uint8_t length) {
     strip.setBrightness(brightness);
 }
 
+void setLEDSegments(uint8_t *data, uint8_t length) {
+    if (length < 1) return; // Ensure there is a flags byte
+    uint8_t flags = data[0];
+    // Each segment uses the same 7-byte layout as setLEDColors
+    for (uint8_t offset = 1; offset + LED_SEGMENT_SIZE <= length; offset += LED_SEGMENT_SIZE) {
+        setLEDColors(&data[offset], LED_SEGMENT_SIZE);
+    }
+    if (flags & LED_BATCH_FLAG_DISPLAY) {
+        strip.show();
+    }
+}
+
 void displayLEDStrip() {
     strip.show();
 }
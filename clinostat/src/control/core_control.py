@@ -1,18 +1,19 @@
 import requests
 from PyQt5.QtWidgets import QFileDialog, QMessageBox
-from src.utils.general_utils import load_static_config
+from src.utils.config_utils import load_static_config
 
-# Load static configuration
-static_config = load_static_config()
-core_ip_address = static_config["core_ip_address"]
-imaging_timeout = static_config.get("imaging_timeout", 20)  # Default to 20 seconds if not set
+def core_url(endpoint):
+    """
+    Return the URL of an endpoint on the core, using the address from the static configuration.
+    """
+    return f"{load_static_config().core_base_url}/{endpoint}"
 
 def send_fan_speed_command(speed, main_window=None):
     """
     Send the fan speed command to the core.
     """
     try:
-        response = requests.post(f"http://{core_ip_address}:5000/fan_speed", data={'speed': speed}, timeout=5)
+        response = requests.post(core_url("fan_speed"), data={'speed': speed}, timeout=5)
         if response.status_code == 200:
             print(f"Sent fan speed command: {speed}")
         else:
@@ -29,7 +30,7 @@ def send_ir_led_command(new_state):
     Send the IR LED command to the core.
     """
     try:
-        response = requests.post(f"http://{core_ip_address}:5000/ir_led", data={'state': new_state})
+        response = requests.post(core_url("ir_led"), data={'state': new_state})
         if response.status_code == 200:
             print(f"Sent IR LED command: {new_state}")
         else:
@@ -49,9 +50,10 @@ def capture_image_command(width, height, zoom_percentage, autofocus=True, lens_p
     }
     if lens_position is not None:
         data['lens_position'] = lens_position
+    imaging_timeout = load_static_config().imaging_timeout
 
     try:
-        response = requests.post(f"http://{core_ip_address}:5000/capture_image", data=data, timeout=imaging_timeout)
+        response = requests.post(core_url("capture_image"), data=data, timeout=imaging_timeout)
         if response.status_code == 200:
             lens_position = response.headers.get('Lens-Position')
             if lens_position:
@@ -90,7 +92,7 @@ def upload_core_update(main_window):
 
     try:
         with open(file_path, 'rb') as file:
-            response = requests.post(f"http://{core_ip_address}:5000/update_code", files={'file': file})
+            response = requests.post(core_url("update_code"), files={'file': file})
             if response.status_code == 200:
                 response_data = response.json()
                 old_version = response_data.get("old_version", "unknown")
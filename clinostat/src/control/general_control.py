@@ -1,4 +1,4 @@
-from src.utils.comms_utils import communication
+from src.utils.comms_utils import get_communication
 
 def audio_feedback(duration=200):
     """
@@ -7,5 +7,5 @@ def audio_feedback(duration=200):
     if duration > 255:
         raise ValueError("Duration must be between 0 and 255 milliseconds.")
     
-    communication.send_i2c_command(0x05, [duration])
+    get_communication().send_i2c_command(0x05, [duration])
     print(f"Sent audio feedback command with duration {duration} ms")
\ No newline at end of file
@@ -1,6 +1,11 @@
-from src.utils.comms_utils import communication
-from src.utils.lighting_utils import save_LED_command
-from src.utils.general_utils import load_dynamic_config, save_dynamic_config
+import time
+import bisect
+import threading
+from src.utils.comms_utils import get_communication
+from src.utils.lighting_utils import (
+    save_LED_command, set_LED_commands, led_command_to_segment, pack_led_segments, get_led_framebuffer
+)
+from src.utils.preset_utils import get_preset_library
 
 
 def send_led_command(start_led, end_led, red, green, blue, white, brightness):
@@ -8,7 +13,8 @@ def send_led_command(start_led, end_led, red, green, blue, white, brightness):
     Send the LED control command to the Arduino.
     """
     payload = [start_led, end_led, red, green, blue, white, brightness]
-    communication.send_i2c_command(0x02, payload)
+    get_led_framebuffer().apply([payload])
+    invalidate_framebuffer_on_failure(get_communication().send_i2c_command(0x02, payload))
     print(f"Sent LED command: {payload}")
 
     # Save the command to the dynamic configuration file
@@ -23,51 +29,217 @@ def send_led_command(start_led, end_led, red, green, blue, white, brightness):
     }
     save_LED_command(command)
 
+def invalidate_framebuffer_on_failure(future):
+    """
+    Forget the host framebuffer if the command fails, as the strip state is then unknown.
+    """
+    future.add_done_callback(lambda done: get_led_framebuffer().invalidate() if done.exception() is not None else None)
+
 def display_led_strip():
     """
     Send the display command to the Arduino to update the LED strip.
     """
-    communication.send_i2c_command(0x04, [])
+    get_communication().send_i2c_command(0x04, [])
     print("Sent display command")
 
 def send_loaded_led_commands(commands):
     """
     Send the LED commands loaded from the configuration file to the Arduino.
+    Only the runs of LEDs that differ from the host framebuffer are sent, batched into as few 0x06
+    packets as possible, the last one showing the strip.
     """
-    for command in commands:
-        payload = [
-            command["start_led"],
-            command["end_led"],
-            command["red"],
-            command["green"],
-            command["blue"],
-            command["white"],
-            command["brightness"]
-        ]
-        communication.send_i2c_command(0x03, payload)
-        print(f"Sent loaded LED command: {payload}")
-    display_led_strip()
-
-def load_preset(preset_number):
-    """
-    Load the preset light settings from the dynamic configuration file and apply them.
+    if not commands:
+        display_led_strip()
+        return
+
+    changes = get_led_framebuffer().diff([led_command_to_segment(command) for command in commands])
+    if not changes:
+        print("LED strip is already up to date")
+        return
+    payloads = pack_led_segments(changes)
+    get_led_framebuffer().apply(changes)
+    communication = get_communication()
+    for payload in payloads:
+        invalidate_framebuffer_on_failure(communication.send_i2c_command(0x06, payload))
+    print(f"Sent {len(changes)} changed LED runs for {len(commands)} loaded LED commands in {len(payloads)} packets")
+
+def load_preset(preset_name, record=True):
+    """
+    Apply a preset from the preset library.
+    Only the payloads for the LEDs that differ from the current strip are sent, taken from the library's cache.
+    With record set the preset also replaces the LED commands in the dynamic configuration, which the
+    lighting cycle skips so that switching presets does not write any files.
     (No popups shown)
     """
-    config = load_dynamic_config()
-    preset_name = f"preset_{preset_number}"
-    if preset_name in config:
-        preset_commands = config[preset_name]
-        send_loaded_led_commands(preset_commands)
-        
-        # Update led_commands in the configuration file
-        config["led_commands"] = preset_commands
-        save_dynamic_config(config)
-    else:
-        # Optional: do nothing or log a warning
-        print(f"Preset {preset_number} not found.")
+    library = get_preset_library()
+    framebuffer = get_led_framebuffer()
+    frames = library.transition(preset_name, framebuffer)
+    if frames is None:
+        print(f"Preset {preset_name} not found.")
+        return
+
+    changes, payloads = frames
+    framebuffer.apply(changes)
+    communication = get_communication()
+    for payload in payloads:
+        invalidate_framebuffer_on_failure(communication.send_i2c_command(0x06, payload))
+    print(f"Loaded preset {preset_name}: {len(changes)} changed LED runs in {len(payloads)} packets")
+
+    if record:
+        set_LED_commands(library.get_commands(preset_name))
 
 def turn_off_all_lights():
     """
     Send the command to turn off all lights.
     """
     send_led_command(1, 130, 0, 0, 0, 0, 255)
+
+class LightingScheduler:
+    """
+    Show a sequence of (target, duration) steps from a scheduler thread, where a target is a preset
+    name or a (preset name, brightness) pair. The schedule repeats unless repeat is False, in which
+    case the last step is left on. offset starts the schedule that many seconds in.
+
+    Step boundaries are absolute monotonic deadlines measured from the start, so late wakeups do not
+    accumulate over multi-day schedules, and the thread sleeps until the next boundary. After a long
+    stall the step that is due now is shown and the ones in between are skipped.
+
+    The 0x06 payloads for every transition are encoded up front against the state the strip is in
+    after the previous step. If the strip is in another state when a step is due, for example after
+    a failed command, the changes are computed from the host framebuffer instead.
+    """
+    def __init__(self, steps, offset=0.0, repeat=True):
+        if not steps:
+            raise ValueError("The lighting schedule has no steps")
+        library = get_preset_library()
+        self.steps = []
+        for target, duration in steps:
+            preset_name, brightness = target if isinstance(target, (tuple, list)) else (target, None)
+            segments = library.get_segments(preset_name)
+            if segments is None:
+                raise ValueError(f"Preset {preset_name} not found.")
+            if duration <= 0:
+                raise ValueError(f"Step durations must be positive, got {duration} for {preset_name}")
+            if brightness is not None:
+                segments = tuple(segment[:6] + (brightness,) for segment in segments)
+            self.steps.append((preset_name, segments, duration))
+        # Step start times within one pass of the schedule
+        self.step_starts = []
+        elapsed = 0.0
+        for _, _, duration in self.steps:
+            self.step_starts.append(elapsed)
+            elapsed += duration
+        self.period = elapsed
+        self.offset = offset % self.period if repeat else min(offset, self.period)
+        self.repeat = repeat
+        self.transitions = self.encode_transitions()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.start_time = None
+        self.current = None  # (pass, step index) being shown
+        self.steps_shown = 0
+        self.steps_skipped = 0
+        self.max_lateness = 0.0
+
+    def encode_transitions(self):
+        """
+        Return, for every step, the strip state expected before it and the (changes, payloads) that reach it.
+        Two passes over the steps from the current strip state give the states the schedule settles into.
+        """
+        framebuffer = get_led_framebuffer().copy()
+        transitions = [None] * len(self.steps)
+        for _ in range(2 if self.repeat else 1):
+            for index, (_, segments, _) in enumerate(self.steps):
+                before = framebuffer.snapshot()
+                changes = framebuffer.diff(segments)
+                transitions[index] = (before, changes, [bytes(payload) for payload in pack_led_segments(changes)] if changes else [])
+                framebuffer.apply(changes)
+        return transitions
+
+    def start(self):
+        self.stop_event.clear()
+        self.start_time = time.monotonic() - self.offset
+        self.thread = threading.Thread(target=self.run, name="lighting_schedule", daemon=True)
+        self.thread.start()
+
+    def stop(self, wait=True):
+        self.stop_event.set()
+        if wait and self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def position(self, now=None):
+        """
+        Return (pass, step index, seconds until the step ends) at the monotonic time now.
+        """
+        elapsed = (time.monotonic() if now is None else now) - self.start_time
+        schedule_pass, elapsed = divmod(elapsed, self.period) if self.repeat else (0, min(elapsed, self.period))
+        index = min(bisect.bisect_right(self.step_starts, elapsed) - 1, len(self.steps) - 1)
+        step_end = self.step_starts[index] + self.steps[index][2]
+        return int(schedule_pass), index, step_end - elapsed
+
+    def status(self):
+        """
+        Return (preset name, seconds remaining in the step), or None if the schedule is not running.
+        """
+        if not self.is_running():
+            return None
+        _, index, remaining = self.position()
+        return self.steps[index][0], remaining
+
+    def run(self):
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            schedule_pass, index, remaining = self.position(now)
+            if (schedule_pass, index) != self.current:
+                if self.current is not None:
+                    deadline = self.start_time + schedule_pass * self.period + self.step_starts[index]
+                    lateness = now - deadline
+                    self.max_lateness = max(self.max_lateness, lateness)
+                    skipped = (schedule_pass * len(self.steps) + index) - (self.current[0] * len(self.steps) + self.current[1]) - 1
+                    self.steps_skipped += max(skipped, 0)
+                self.show_step(index)
+                self.current = (schedule_pass, index)
+                self.steps_shown += 1
+            if not self.repeat and self.start_time + self.period <= now:
+                break
+            # Sleep until the absolute deadline of the next step
+            deadline = self.start_time + schedule_pass * self.period + self.step_starts[index] + self.steps[index][2]
+            remaining = deadline - time.monotonic()
+            while remaining > 0:
+                if self.stop_event.wait(remaining):
+                    return
+                remaining = deadline - time.monotonic()
+        print(f"Lighting schedule finished: {self.steps_shown} steps shown, {self.steps_skipped} skipped, max lateness {self.max_lateness * 1000:.2f} ms")
+
+    def show_step(self, index):
+        framebuffer = get_led_framebuffer()
+        before, changes, payloads = self.transitions[index]
+        if framebuffer.snapshot() != before:
+            changes = framebuffer.diff(self.steps[index][1])
+            payloads = pack_led_segments(changes) if changes else []
+        framebuffer.apply(changes)
+        communication = get_communication()
+        for payload in payloads:
+            invalidate_framebuffer_on_failure(communication.send_i2c_command(0x06, payload))
+
+_lighting_scheduler = None
+
+def start_lighting_schedule(steps, offset=0.0, repeat=True):
+    """
+    Start a lighting schedule of (target, duration) steps, replacing any running schedule.
+    """
+    global _lighting_scheduler
+    stop_lighting_schedule()
+    _lighting_scheduler = LightingScheduler(steps, offset, repeat)
+    _lighting_scheduler.start()
+    return _lighting_scheduler
+
+def stop_lighting_schedule():
+    if _lighting_scheduler is not None:
+        _lighting_scheduler.stop()
+
+def get_lighting_scheduler():
+    return _lighting_scheduler
@@ -1,8 +1,10 @@
-import math
-from src.utils.comms_utils import communication
+import time
+import threading
+from src.utils.comms_utils import get_communication
 from src.utils.runtime_state import runtime_state
 from src.utils.general_utils import save_dynamic_config, load_dynamic_config
-from src.utils.motion_utils import calculate_motor_speed
+from src.utils.motion_utils import calculate_motor_speed, encode_motion_profile
+from src.utils.framing_utils import encode_motor_state
 
 def set_motor_speed(frame_rpm=None, core_rpm=None):
     """
@@ -17,31 +19,14 @@ def set_motor_speed(frame_rpm=None, core_rpm=None):
         runtime_state.set_motor_sps(2, core_sps)
         runtime_state.set_motor_microstepping(2, core_microstepping)
 
-    frame_enabled = runtime_state.motor_states[1]["enabled"]
-    core_enabled = runtime_state.motor_states[2]["enabled"]
-
-    frame_sps_bytes = [
-        (int(runtime_state.motor_states[1]["sps"] * 1000) >> 16) & 0xFF,
-        (int(runtime_state.motor_states[1]["sps"] * 1000) >> 8) & 0xFF,
-        int(runtime_state.motor_states[1]["sps"] * 1000) & 0xFF,
-    ]
-    core_sps_bytes = [
-        (int(runtime_state.motor_states[2]["sps"] * 1000) >> 16) & 0xFF,
-        (int(runtime_state.motor_states[2]["sps"] * 1000) >> 8) & 0xFF,
-        int(runtime_state.motor_states[2]["sps"] * 1000) & 0xFF,
-    ]
-
-    payload = [
-        int(frame_enabled)
-    ] + frame_sps_bytes + [
-        int(math.log2(runtime_state.motor_states[1]["microstepping"])),
-        int(runtime_state.motor_states[1]["direction_cw"]),
-        int(core_enabled)
-    ] + core_sps_bytes + [
-        int(math.log2(runtime_state.motor_states[2]["microstepping"])),
-        int(runtime_state.motor_states[2]["direction_cw"])
-    ]
-    communication.send_i2c_command(0x01, payload)
+    frame_state = runtime_state.motor_states[1]
+    core_state = runtime_state.motor_states[2]
+    payload = encode_motor_state(
+        frame_state["enabled"], frame_state["sps"], frame_state["microstepping"], frame_state["direction_cw"]
+    ) + encode_motor_state(
+        core_state["enabled"], core_state["sps"], core_state["microstepping"], core_state["direction_cw"]
+    )
+    get_communication().send_i2c_command(0x01, payload)
 
     # Save the state
     config = load_dynamic_config()
@@ -51,4 +36,81 @@ def set_motor_speed(frame_rpm=None, core_rpm=None):
     config["frame_motor_direction_cw"] = motor_states[1]["direction_cw"]
     config["core_motor_direction_cw"] = motor_states[2]["direction_cw"]
     config["linked"] = runtime_state.linked
-    save_dynamic_config(config)
\ No newline at end of file
+    save_dynamic_config(config)
+
+class MotionProfilePlayer:
+    """
+    Play a timeline of motor setpoints from a scheduler thread.
+    All 0x01 payloads are encoded up front; each step is sent at an absolute monotonic deadline
+    measured from the start, so waiting errors do not accumulate over long profiles.
+    A step that is still unsent when the next one is due is skipped.
+    Steps closer together than i2c_coalesce_max_rate allows are merged by the I2C writer.
+    """
+    def __init__(self, timeline):
+        self.steps = encode_motion_profile(timeline)
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.steps_sent = 0
+        self.steps_skipped = 0
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="motion_profile", daemon=True)
+        self.thread.start()
+
+    def stop(self, wait=True):
+        self.stop_event.set()
+        if wait and self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def run(self):
+        communication = get_communication()
+        start_time = time.monotonic()
+        for index, (step_time, payload, motor_states) in enumerate(self.steps):
+            deadline = start_time + step_time
+            remaining = deadline - time.monotonic()
+            while remaining > 0:
+                if self.stop_event.wait(remaining):
+                    return
+                remaining = deadline - time.monotonic()
+            if self.stop_event.is_set():
+                return
+
+            if index + 1 < len(self.steps) and time.monotonic() >= start_time + self.steps[index + 1][0]:
+                self.steps_skipped += 1  # Superseded by the next setpoint
+                continue
+
+            communication.send_i2c_command(0x01, payload)
+            lateness = time.monotonic() - deadline
+            self.steps_sent += 1
+            self.total_lateness += lateness
+            self.max_lateness = max(self.max_lateness, lateness)
+            for motor_id, state in motor_states.items():
+                runtime_state.set_motor_speed(motor_id, state["speed"])
+                runtime_state.set_motor_direction(motor_id, state["direction_cw"])
+                runtime_state.set_motor_state(motor_id, state["enabled"])
+                runtime_state.set_motor_sps(motor_id, state["sps"])
+                runtime_state.set_motor_microstepping(motor_id, state["microstepping"])
+        print(f"Motion profile finished: {self.steps_sent} steps sent, {self.steps_skipped} skipped, max lateness {self.max_lateness * 1000:.2f} ms")
+
+_motion_profile_player = None
+
+def start_motion_profile(timeline):
+    """
+    Start playing a timeline of (time, frame_rpm, core_rpm, direction) setpoints, replacing any running profile.
+    The motors hold the last setpoint when the profile ends.
+    """
+    global _motion_profile_player
+    stop_motion_profile()
+    _motion_profile_player = MotionProfilePlayer(timeline)
+    _motion_profile_player.start()
+    return _motion_profile_player
+
+def stop_motion_profile():
+    if _motion_profile_player is not None:
+        _motion_profile_player.stop()
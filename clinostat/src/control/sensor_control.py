@@ -1,166 +1,245 @@
 import os
 import time
-import csv
 import threading
 
-from src.utils.general_utils import load_static_config
-from src.utils.comms_utils import communication
+from src.utils.config_utils import load_static_config
 from src.utils.runtime_state import runtime_state  # Import runtime_state
+from src.utils.rotation_utils import RotationRateEstimator, compare_with_commanded
+from src.utils.buffer_utils import RingBuffer, ArchiveWriter
+from src.utils.log_utils import SensorLog
 
-# Load static configuration
-static_config = load_static_config()
-ambient_sensor_address = static_config["ambient_sensor_address"]
-MAX_AMBIENT_RECENT_DATA_POINTS = static_config["max_ambient_recent_data_points"]
-MAX_AMBIENT_ARCHIVED_DATA_POINTS = static_config["max_ambient_archived_data_points"]
-MAX_MOTION_RECENT_DATA_POINTS = static_config["max_motion_recent_data_points"]
-MAX_MOTION_ARCHIVED_DATA_POINTS = static_config["max_motion_archived_data_points"]
-
-# Global lists to store temporary file names and data
-ambient_temp_file_names = []
-motion_temp_file_names = []
-archived_ambient_data_list = []
-archived_motion_data_list = []
-recent_ambient_data_list = []
-recent_motion_data_list = []
-
-def clear_old_temp_files(file_type):
-    global ambient_temp_file_names, motion_temp_file_names
-    """
-    Clear old temporary files starting with 'ambient_sensor_data' or 'motion_sensor_data'.
-    """
-    temp_dir = "/home/pi/Documents/clinostat/temp"
-    if os.path.exists(temp_dir):
-        for temp_file in os.listdir(temp_dir):
-            if file_type == "ambient" and temp_file.startswith("ambient_sensor_data") and temp_file.endswith(".csv"):
-                os.remove(os.path.join(temp_dir, temp_file))
-            elif file_type == "motion" and temp_file.startswith("motion_sensor_data") and temp_file.endswith(".csv"):
-                os.remove(os.path.join(temp_dir, temp_file))
+# Channels of the recent data buffers
+AMBIENT_CHANNELS = [("timestamp", "f8"), ("temperature", "f8"), ("humidity", "f8"), ("pressure", "f8")]
+MOTION_CHANNELS = [("timestamp", "f8"), ("acceleration", "f8", 3), ("gyro", "f8", 3)]
+# The motion archive keeps the axes as float32, 32 bytes per sample
+ARCHIVED_MOTION_CHANNELS = [("timestamp", "f8"), ("acceleration", "f4", 3), ("gyro", "f4", 3)]
 
-def sample_ambient_data(main_window, update_rate, start_time, sampling_event, bme280, max_retries=10):
-    global ambient_temp_file_names, archived_ambient_data_list, recent_ambient_data_list
+# CSV columns of the archived and exported data
+AMBIENT_FIELDNAMES = ["timestamp", "temperature", "humidity", "pressure"]
+MOTION_FIELDNAMES = ["timestamp", "x_acc", "y_acc", "z_acc", "x_gyro", "y_gyro", "z_gyro"]
+
+# Directory of the binary sensor logs, one log per stream and sampling session
+SENSOR_LOG_DIR = "/home/pi/Documents/clinostat/data"
+
+# Channels, capacity setting and CSV columns of the archive for each stream
+ARCHIVE_SETTINGS = {
+    "ambient_sensor_data": (AMBIENT_CHANNELS, "max_ambient_archived_data_points", AMBIENT_FIELDNAMES),
+    "motion_sensor_data": (ARCHIVED_MOTION_CHANNELS, "max_motion_archived_data_points", MOTION_FIELDNAMES),
+}
+
+rotation_estimator = None
+
+_archive_writers = {}
+_sensor_logs = {}
+_archive_writers_lock = threading.Lock()
+
+_recent_ambient_data = None
+_recent_motion_data = None
+_recent_data_lock = threading.Lock()
+
+def get_recent_ambient_data():
     """
-    Sample data from the sensor and add it to the lists.
+    Return the ring buffer of the most recent ambient samples.
     """
-    clear_old_temp_files("ambient")  # Clear old ambient temp files at the start
-    retry_count = 0
+    global _recent_ambient_data
+    with _recent_data_lock:
+        if _recent_ambient_data is None:
+            _recent_ambient_data = RingBuffer(load_static_config().max_ambient_recent_data_points, AMBIENT_CHANNELS)
+        return _recent_ambient_data
 
-    while sampling_event.is_set():
-        try:
-            # Read data from the sensor
-            elapsed_time = round(time.time() - start_time, 3)  # Calculate elapsed time in seconds and round to 3 decimal places
-            temperature = round(bme280.temperature + runtime_state.temperature_offset, 3)
-            humidity = round(bme280.relative_humidity + runtime_state.humidity_offset, 3)
-            pressure = round(bme280.pressure + runtime_state.pressure_offset, 3)
-
-            # Add data to the recent_data_list
-            recent_ambient_data_list.append({"timestamp": elapsed_time, "temperature": temperature, "humidity": humidity, "pressure": pressure})
-
-            # If recent_data_list exceeds the maximum size, move the oldest data point to archived_data_list
-            if len(recent_ambient_data_list) > MAX_AMBIENT_RECENT_DATA_POINTS:
-                archived_ambient_data_list.append(recent_ambient_data_list.pop(0))
-
-            # If archived_ambient_data_list exceeds the maximum size, save it to a temporary CSV file and clear the list
-            if len(archived_ambient_data_list) >= MAX_AMBIENT_ARCHIVED_DATA_POINTS:
-                threading.Thread(target=save_archived_data_to_csv, args=("ambient_sensor_data",)).start()
-
-            # Emit the custom signal to update the UI
-            main_window.new_ambient_sensor_data.emit()
-
-            # Wait for the specified update rate in 1-second intervals
-            elapsed_time = 0
-            while elapsed_time < update_rate and sampling_event.is_set():
-                time.sleep(1)
-                elapsed_time += 1
-
-            # Reset retry count after a successful read
-            retry_count = 0
-        except OSError as e:
-            if e.errno == 121:  # Remote I/O error
-                print("Ambient sensor not connected.")
-                retry_count += 1
-                if retry_count >= max_retries:
-                    sampling_event.clear()
-                    main_window.ambient_sensor_error.emit()
-                    break
-                else:
-                    print(f"Retrying... ({retry_count}/{max_retries})")
-                    time.sleep(1)  # Wait before retrying
-
-def sample_motion_data(main_window, update_rate, start_time, motion_sampling_event, motion_sensor, max_retries=10):
-    global motion_temp_file_names, archived_motion_data_list, recent_motion_data_list
+def get_recent_motion_data():
     """
-    Sample data from the motion sensor and add it to the lists.
+    Return the ring buffer of the most recent motion samples.
     """
-    clear_old_temp_files("motion")  # Clear old motion temp files at the start
-    retry_count = 0
+    global _recent_motion_data
+    with _recent_data_lock:
+        if _recent_motion_data is None:
+            _recent_motion_data = RingBuffer(load_static_config().max_motion_recent_data_points, MOTION_CHANNELS)
+        return _recent_motion_data
 
-    while motion_sampling_event.is_set():
+def prune_sensor_logs(prefix, keep):
+    """
+    Delete the stream's oldest sensor logs and their indexes, keeping the newest keep logs.
+    """
+    # Log names end in a nanosecond timestamp of fixed width, so name order is age order
+    logs = sorted(name for name in os.listdir(SENSOR_LOG_DIR) if name.startswith(f"{prefix}_") and name.endswith(".log"))
+    for name in logs[:max(0, len(logs) - keep)]:
+        path = os.path.join(SENSOR_LOG_DIR, name)
         try:
-            # Read data from the motion sensor
-            elapsed_time = round(time.time() - start_time, 3)  # Calculate elapsed time in seconds
-            acceleration = tuple(round(val, 3) for val in motion_sensor.acceleration)
-            gyro = tuple(round(val, 3) for val in motion_sensor.gyro)
-
-            # Add data to the recent_motion_data_list
-            recent_motion_data_list.append({"timestamp": elapsed_time, "acceleration": acceleration, "gyro": gyro})
-
-            # If recent_motion_data_list exceeds the maximum size, move the oldest data point to archived_motion_data_list
-            if len(recent_motion_data_list) > MAX_MOTION_RECENT_DATA_POINTS:
-                archived_motion_data_list.append(recent_motion_data_list.pop(0))
+            os.remove(path)
+            if os.path.exists(f"{path}.idx"):
+                os.remove(f"{path}.idx")
+            print(f"Deleted old sensor log: {path}")
+        except OSError as e:
+            print(f"Error deleting sensor log {path}: {e}")
 
-            # If archived_motion_data_list exceeds the maximum size, save it to a temporary CSV file and clear the list
-            if len(archived_motion_data_list) >= MAX_MOTION_ARCHIVED_DATA_POINTS:
-                threading.Thread(target=save_archived_data_to_csv, args=("motion_sensor_data",)).start()
+def start_sensor_log(prefix):
+    """
+    Start a new sensor log for the stream's sampling session, closing the previous one.
+    Only the newest sensor_log_retention logs of the stream are kept.
+    """
+    channels = ARCHIVE_SETTINGS[prefix][0]
+    os.makedirs(SENSOR_LOG_DIR, exist_ok=True)
+    prune_sensor_logs(prefix, load_static_config().sensor_log_retention - 1)  # Leave room for the new log
+    log = SensorLog(os.path.join(SENSOR_LOG_DIR, f"{prefix}_{time.time_ns()}.log"), channels)
+    log.open()
+    with _archive_writers_lock:
+        previous = _sensor_logs.get(prefix)
+        _sensor_logs[prefix] = log
+    if previous is not None:
+        previous.close()
+    print(f"Sensor log started: {log.path}")
+    return log
+
+def get_sensor_log(prefix):
+    """
+    Return the sensor log of the stream's current or last sampling session, or None if it has not been sampled.
+    """
+    with _archive_writers_lock:
+        return _sensor_logs.get(prefix)
 
-            # Emit the custom signal to update the UI
-            main_window.new_motion_sensor_data.emit()
+def get_archive_writer(prefix):
+    """
+    Return the double-buffered archive for the stream, whose writer thread appends the buffers to the sensor log.
+    """
+    with _archive_writers_lock:
+        if prefix not in _archive_writers:
+            channels, capacity_key, _ = ARCHIVE_SETTINGS[prefix]
+            static_config = load_static_config()
+            _archive_writers[prefix] = ArchiveWriter(
+                prefix, getattr(static_config, capacity_key), channels,
+                lambda archive: get_sensor_log(prefix).append(archive.columns()),
+                flush_interval=static_config.sensor_log_flush_interval
+            )
+        return _archive_writers[prefix]
+
+def clear_archived_data(prefix):
+    get_archive_writer(prefix).clear()
+
+def write_sensor_data_csv(prefix, file):
+    """
+    Write every sample of the stream's current or last session to an open text file as CSV rows.
+    The samples not yet in the sensor log are written to it first.
+    """
+    writer = get_archive_writer(prefix)
+    writer.flush()
+    writer.wait()
+    log = get_sensor_log(prefix)
+    if log is not None:
+        log.write_csv(file)
 
-            # Wait for the specified update rate in 1-second intervals
-            elapsed_time = 0
-            while elapsed_time < update_rate and motion_sampling_event.is_set():
-                time.sleep(0.01)
-                elapsed_time += 0.01
+def sample_ambient_data(main_window, update_rate, start_time, sampling_event, bme280, max_retries=10):
+    """
+    Sample data from the sensor and add it to the recent data buffer and the sensor log.
+    """
+    retry_count = 0
+    recent_ambient_data = get_recent_ambient_data()
+    start_sensor_log("ambient_sensor_data")
+    archive = get_archive_writer("ambient_sensor_data")
+
+    try:
+        while sampling_event.is_set():
+            try:
+                # Read data from the sensor
+                elapsed_time = round(time.time() - start_time, 3)  # Calculate elapsed time in seconds and round to 3 decimal places
+                temperature = round(bme280.temperature + runtime_state.temperature_offset, 3)
+                humidity = round(bme280.relative_humidity + runtime_state.humidity_offset, 3)
+                pressure = round(bme280.pressure + runtime_state.pressure_offset, 3)
+
+                recent_ambient_data.append(elapsed_time, temperature, humidity, pressure)
+                archive.append(elapsed_time, temperature, humidity, pressure)
+
+                # Emit the custom signal to update the UI
+                main_window.new_ambient_sensor_data.emit()
+
+                # Wait for the specified update rate in 1-second intervals
+                elapsed_time = 0
+                while elapsed_time < update_rate and sampling_event.is_set():
+                    time.sleep(1)
+                    elapsed_time += 1
+
+                # Reset retry count after a successful read
+                retry_count = 0
+            except OSError as e:
+                if e.errno == 121:  # Remote I/O error
+                    print("Ambient sensor not connected.")
+                    retry_count += 1
+                    if retry_count >= max_retries:
+                        sampling_event.clear()
+                        main_window.ambient_sensor_error.emit()
+                        break
+                    else:
+                        print(f"Retrying... ({retry_count}/{max_retries})")
+                        time.sleep(1)  # Wait before retrying
+    finally:
+        # Write the rest of the session to the sensor log
+        archive.flush()
+        archive.wait()
 
-            # Reset retry count after a successful read
-            retry_count = 0
-        except OSError as e:
-            if e.errno == 121:  # Remote I/O error
-                print("Motion sensor not connected.")
-                retry_count += 1
-                if retry_count >= max_retries:
-                    motion_sampling_event.clear()
-                    main_window.motion_sensor_error.emit()
-                    break
-                else:
-                    print(f"Retrying... ({retry_count}/{max_retries})")
-                    time.sleep(1)  # Wait before retrying
-
-def save_archived_data_to_csv(prefix):
-    global ambient_temp_file_names, motion_temp_file_names, archived_ambient_data_list, archived_motion_data_list
-    """
-    Save the archived data to a temporary CSV file and clear the list.
-    """
-    # Define the temporary file path
-    temp_dir = "/home/pi/Documents/clinostat/temp"
-    temp_file_path = os.path.join(temp_dir, f"{prefix}_{int(time.time())}.csv")
-
-    # Ensure the temp directory exists
-    os.makedirs(temp_dir, exist_ok=True)
-
-    # Save the archived data to the temporary CSV file
-    with open(temp_file_path, mode='w', newline='') as file:
-        if prefix == "ambient_sensor_data":
-            writer = csv.DictWriter(file, fieldnames=["timestamp", "temperature", "humidity", "pressure"])
-            writer.writeheader()
-            writer.writerows(archived_ambient_data_list)
-            ambient_temp_file_names.append(temp_file_path)
-            archived_ambient_data_list.clear()
-        else:
-            writer = csv.DictWriter(file, fieldnames=["timestamp", "acceleration", "gyro"])
-            writer.writeheader()
-            writer.writerows(archived_motion_data_list)
-            motion_temp_file_names.append(temp_file_path)
-            archived_motion_data_list.clear()
-
-    # Print the directory where the temporary file is saved
-    print(f"Temporary file saved: {temp_file_path}")
\ No newline at end of file
+def sample_motion_data(main_window, update_rate, start_time, motion_sampling_event, motion_sensor, max_retries=10):
+    global rotation_estimator
+    """
+    Sample data from the motion sensor and add it to the recent data buffer and the sensor log.
+    The gyro data is also fed to the rotation rate estimator.
+    """
+    retry_count = 0
+    static_config = load_static_config()
+    recent_motion_data = get_recent_motion_data()
+    start_sensor_log("motion_sensor_data")
+    archive = get_archive_writer("motion_sensor_data")
+    rotation_estimator = RotationRateEstimator(window=static_config.rotation_estimate_window, core_axis=static_config.gyro_core_axis)
+
+    try:
+        while motion_sampling_event.is_set():
+            try:
+                # Read data from the motion sensor
+                elapsed_time = round(time.time() - start_time, 3)  # Calculate elapsed time in seconds
+                acceleration = tuple(round(val, 3) for val in motion_sensor.acceleration)
+                raw_gyro = motion_sensor.gyro
+                gyro = tuple(round(val, 3) for val in raw_gyro)
+                rotation_estimator.add_sample(time.time() - start_time, raw_gyro)
+
+                recent_motion_data.append(elapsed_time, acceleration, gyro)
+                archive.append(elapsed_time, acceleration, gyro)
+
+                # Emit the custom signal to update the UI
+                main_window.new_motion_sensor_data.emit()
+
+                # Wait for the specified update rate in 1-second intervals
+                elapsed_time = 0
+                while elapsed_time < update_rate and motion_sampling_event.is_set():
+                    time.sleep(0.01)
+                    elapsed_time += 0.01
+
+                # Reset retry count after a successful read
+                retry_count = 0
+            except OSError as e:
+                if e.errno == 121:  # Remote I/O error
+                    print("Motion sensor not connected.")
+                    retry_count += 1
+                    if retry_count >= max_retries:
+                        motion_sampling_event.clear()
+                        main_window.motion_sensor_error.emit()
+                        break
+                    else:
+                        print(f"Retrying... ({retry_count}/{max_retries})")
+                        time.sleep(1)  # Wait before retrying
+    finally:
+        # Write the rest of the session to the sensor log
+        archive.flush()
+        archive.wait()
+
+def get_rotation_report():
+    """
+    Return the measured frame and core rotation rates compared with the commanded motor states,
+    or None if no motion data has been sampled.
+    """
+    if rotation_estimator is None:
+        return None
+    estimate = rotation_estimator.estimate()
+    if estimate is None:
+        return None
+    motor_settings = load_static_config().motor_settings
+    report = compare_with_commanded(estimate, runtime_state.motor_states, motor_settings.motor_steps, motor_settings.gear_ratio)
+    report["core"]["measured_phase_rpm"] = estimate["core_phase_rpm"]
+    return report
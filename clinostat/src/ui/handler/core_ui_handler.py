@@ -1,15 +1,11 @@
 from src.ui.updater import core_ui_updater, general_ui_updater
-from src.utils.general_utils import load_static_config, load_dynamic_config, save_dynamic_config, check_storage
+from src.utils.general_utils import load_dynamic_config, save_dynamic_config, check_storage
 from src.control.core_control import send_fan_speed_command, send_ir_led_command, capture_image_command
 import threading
 from PyQt5.QtCore import QTimer
 from src.utils.runtime_state import runtime_state
 import os
 
-# Load static configuration
-static_config = load_static_config()
-core_ip_address = static_config["core_ip_address"]
-
 timelapse_timer = None
 timelapse_remaining_time = 0
 countdown_timer = None
@@ -1,6 +1,8 @@
+import math
 from src.utils.general_utils import save_dynamic_config, load_dynamic_config
-from src.utils.lighting_utils import save_LED_preset, clear_LED_commands
-from src.control.lighting_control import send_led_command, load_preset, turn_off_all_lights
+from src.utils.lighting_utils import clear_LED_commands
+from src.utils.preset_utils import save_LED_preset
+from src.control.lighting_control import send_led_command, turn_off_all_lights, start_lighting_schedule, stop_lighting_schedule, get_lighting_scheduler
 from src.ui.updater.lighting_ui_updater import reset_led_spinbox, update_lighting_cycle_ui
 from PyQt5.QtCore import QTimer
 
@@ -32,11 +34,10 @@ def LED_reset(main_window):
     turn_off_all_lights()
     reset_led_spinbox(main_window)
 
-def save_preset(preset_number):
+def save_preset(preset_name):
     """
     Save the current series of lighting commands as a preset.
     """
-    preset_name = f"preset_{preset_number}"
     save_LED_preset(preset_name)
     clear_LED_commands()
     turn_off_all_lights()
@@ -44,12 +45,14 @@ def save_preset(preset_number):
 def start_lighting_cycle(main_window):
     """
     Start or stop the lighting cycle between preset 1 and preset 2.
+    The presets are switched by the lighting scheduler; the timer only refreshes the countdown on the button.
     """
     if getattr(main_window, 'lighting_cycle_running', False):
         # Stop the cycle
         main_window.lighting_cycle_running = False
+        stop_lighting_schedule()
         
-        # Stop the timer if present
+        # Stop the countdown timer if present
         if hasattr(main_window, 'lighting_cycle_timer'):
             main_window.lighting_cycle_timer.stop()
         
@@ -60,12 +63,9 @@ def start_lighting_cycle(main_window):
         update_lighting_cycle_ui(main_window, is_running=False)
         return
 
-    # Otherwise, start the cycle
-    main_window.lighting_cycle_running = True
-    
     # Store durations in seconds
-    main_window.preset_1_duration = main_window.lighting_preset_1_duration_value_spinBox.value() * 60
-    main_window.preset_2_duration = main_window.lighting_preset_2_duration_value_spinBox.value() * 60
+    preset_1_duration = main_window.lighting_preset_1_duration_value_spinBox.value() * 60
+    preset_2_duration = main_window.lighting_preset_2_duration_value_spinBox.value() * 60
     
     # Record the values in the dynamic configuration
     config = load_dynamic_config()
@@ -73,41 +73,29 @@ def start_lighting_cycle(main_window):
     config["preset_2_duration"] = main_window.lighting_preset_2_duration_value_spinBox.value()
     save_dynamic_config(config)
     
-    # Initialize cycle state
-    main_window.current_preset = 1
-    main_window.current_countdown = main_window.preset_1_duration
-    
-    # Load the first preset immediately
-    load_preset(main_window.current_preset)
+    # Start the schedule, which loads the first preset immediately
+    try:
+        start_lighting_schedule([("preset_1", preset_1_duration), ("preset_2", preset_2_duration)])
+    except ValueError as e:
+        print(f"Cannot start the lighting cycle: {e}")
+        return
+    main_window.lighting_cycle_running = True
     
-    # Create or reuse a QTimer that ticks every second
+    # Create or reuse a QTimer that refreshes the countdown every second
     if not hasattr(main_window, 'lighting_cycle_timer'):
         main_window.lighting_cycle_timer = QTimer(main_window)
     
-    def cycle_tick():
-        if not main_window.lighting_cycle_running:
+    def update_countdown():
+        scheduler = get_lighting_scheduler()
+        status = scheduler.status() if scheduler is not None else None
+        if not main_window.lighting_cycle_running or status is None:
             return
-        
-        main_window.current_countdown -= 1
-        
-        # Update the button text with the remaining time
-        update_lighting_cycle_ui(main_window, is_running=True, seconds=main_window.current_countdown)
-        
-        # If the countdown finishes, switch presets
-        if main_window.current_countdown <= 0:
-            # Toggle preset
-            main_window.current_preset = 2 if main_window.current_preset == 1 else 1
-            load_preset(main_window.current_preset)
-            
-            # Reset countdown to the chosen preset's duration
-            if main_window.current_preset == 1:
-                main_window.current_countdown = main_window.preset_1_duration
-            else:
-                main_window.current_countdown = main_window.preset_2_duration
+        _, remaining = status
+        update_lighting_cycle_ui(main_window, is_running=True, seconds=math.ceil(remaining))
     
     main_window.lighting_cycle_timer.timeout.disconnect() if main_window.lighting_cycle_timer.receivers(main_window.lighting_cycle_timer.timeout) else None
-    main_window.lighting_cycle_timer.timeout.connect(cycle_tick)
-    main_window.lighting_cycle_timer.start(1000)  # Tick every 1 second
+    main_window.lighting_cycle_timer.timeout.connect(update_countdown)
+    main_window.lighting_cycle_timer.start(1000)  # Refresh every second
     
     # Update UI to reflect running state
-    update_lighting_cycle_ui(main_window, is_running=True, seconds=main_window.current_countdown)
\ No newline at end of file
+    update_countdown()
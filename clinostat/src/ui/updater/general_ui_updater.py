@@ -82,6 +82,14 @@ def initialize_graphs(main_window):
     setup_motion_accelerometer_graph(main_window.motion_accelerometer_graphWidget)
     setup_motion_gyroscope_graph(main_window.motion_gyroscope_graphWidget)
 
+def show_communication_error(main_window):
+    """
+    Mark the window title when an I2C command to the Arduino has failed.
+    """
+    title = main_window.windowTitle()
+    if "(I2C error)" not in title:
+        main_window.setWindowTitle(f"{title} (I2C error)")
+
 def display_image(main_window, image_data=None, image_path=None):
     """
     Display an image on the main_image_pushButton. If image_data is provided, it will be used.
@@ -1,30 +1,18 @@
-import os
-import json
 from src.control.lighting_control import send_led_command as send_led_cmd
+from src.utils.config_utils import load_static_config
 
 def reset_led_spinbox(main_window):
     """
-    Read the LED settings from the JSON configuration file and set the values to the UI.
+    Set the default LED settings from the static configuration to the UI.
     """
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    config_path = os.path.join(script_dir, "../../../config/static_config.json")
-    
-    try:
-        with open(config_path, "r") as file:
-            config = json.load(file)
-        
-        led_settings = config["led_settings"]
-        main_window.lighting_start_LED_value_spinBox.setValue(led_settings["default_start_led"])
-        main_window.lighting_end_LED_value_spinBox.setValue(led_settings["default_end_led"])
-        main_window.lighting_red_value_spinBox.setValue(led_settings["default_red"])
-        main_window.lighting_green_value_spinBox.setValue(led_settings["default_green"])
-        main_window.lighting_blue_value_spinBox.setValue(led_settings["default_blue"])
-        main_window.lighting_white_value_spinBox.setValue(led_settings["default_white"])
-        main_window.lighting_brightness_value_spinBox.setValue(led_settings["default_brightness"])
-    except FileNotFoundError:
-        print(f"Configuration file not found: {config_path}")
-    except json.JSONDecodeError:
-        print(f"Error decoding JSON from the configuration file: {config_path}")
+    led_settings = load_static_config().led_settings
+    main_window.lighting_start_LED_value_spinBox.setValue(led_settings.default_start_led)
+    main_window.lighting_end_LED_value_spinBox.setValue(led_settings.default_end_led)
+    main_window.lighting_red_value_spinBox.setValue(led_settings.default_red)
+    main_window.lighting_green_value_spinBox.setValue(led_settings.default_green)
+    main_window.lighting_blue_value_spinBox.setValue(led_settings.default_blue)
+    main_window.lighting_white_value_spinBox.setValue(led_settings.default_white)
+    main_window.lighting_brightness_value_spinBox.setValue(led_settings.default_brightness)
 
 def update_lighting_cycle_ui(main_window, is_running, seconds=None):
     """
@@ -16,16 +16,17 @@ def update_pressure(main_window, pressure):
     """
     main_window.ambient_pressure_value_label.setText(f"{pressure:.1f} hPa")
 
-def update_ambient_graph(graph_widget, data_type, pen, recent_data_list):
+def update_ambient_graph(graph_widget, data_type, pen, recent_data):
     """
     Update the graph with the latest data.
     """
-    if not recent_data_list:
+    if not len(recent_data):
         return
 
-    # Get the elapsed times and values
-    elapsed_times = [data["timestamp"] for data in recent_data_list]
-    values = [data[data_type] for data in recent_data_list]
+    # Get views of the elapsed times and values
+    views = recent_data.views()
+    elapsed_times = views["timestamp"]
+    values = views[data_type]
 
     graph_widget.clear()
     graph_widget.plot(elapsed_times, values, pen=pen)
@@ -46,18 +47,17 @@ def update_gyro(main_window, gyro):
     main_window.motion_y_axis_value_label.setText(f"Y: {gyro[1]:.2f}")
     main_window.motion_z_axis_value_label.setText(f"Z: {gyro[2]:.2f}")
 
-def update_motion_graph(graph_widget, data_type, recent_data_list, x_pen, y_pen, z_pen):
+def update_motion_graph(graph_widget, data_type, recent_data, x_pen, y_pen, z_pen):
     """
     Update the graph with the latest acceleration or gyro data for all three axes.
     """
-    if not recent_data_list:
+    if not len(recent_data):
         return
 
-    # Get the elapsed times and values for each axis
-    elapsed_times = [data["timestamp"] for data in recent_data_list]
-    x_values = [data[data_type][0] for data in recent_data_list]
-    y_values = [data[data_type][1] for data in recent_data_list]
-    z_values = [data[data_type][2] for data in recent_data_list]
+    # Get views of the elapsed times and values for each axis
+    views = recent_data.views()
+    elapsed_times = views["timestamp"]
+    x_values, y_values, z_values = views[data_type]
 
     graph_widget.clear()
     graph_widget.plot(elapsed_times, x_values, pen=x_pen, name="X Axis")
@@ -0,0 +1,308 @@
+import time
+import queue
+import threading
+import numpy as np
+
+def parse_channels(channels):
+    """
+    Return (name, dtype, width) for channels given as (name, dtype) or (name, dtype, width) tuples.
+    """
+    return [(channel[0], np.dtype(channel[1]), channel[2] if len(channel) > 2 else 1) for channel in channels]
+
+def columns_to_rows(channels, columns):
+    """
+    Convert channel arrays, with multi-axis channels stored axis first, into a list of row dictionaries
+    of Python values, with tuples for multi-axis channels.
+    """
+    values = [
+        columns[name].tolist() if width == 1 else [tuple(axes) for axes in columns[name].T.tolist()]
+        for name, _, width in channels
+    ]
+    names = [name for name, _, _ in channels]
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+def write_columns_csv(file, channels, columns, count, chunk_size=65536):
+    """
+    Write the first count samples of channel arrays to an open text file as CSV rows, one column per axis,
+    in bulk writes of chunk_size rows. float32 channels are written with the 7 significant digits they hold.
+    Rows end in \r\n like those of the csv module, so the file should be opened with newline=''.
+    """
+    formats = []
+    for _, dtype, width in channels:
+        formats.extend(["%.7g" if dtype.itemsize <= 4 else "%.15g"] * width)
+    for start in range(0, count, chunk_size):
+        end = min(start + chunk_size, count)
+        rows = []
+        for name, _, width in channels:
+            array = columns[name][..., start:end]
+            rows.extend([array] if width == 1 else list(array))
+        np.savetxt(file, np.column_stack(rows), fmt=formats, delimiter=",", newline="\r\n")
+
+class RingBuffer:
+    """
+    Fixed-capacity columnar ring buffer with one NumPy array per channel.
+
+    channels is a list of (name, dtype) or (name, dtype, width) tuples, in the order values are
+    passed to append. Every sample is written twice, at its slot and one ring length further on,
+    so the most recent samples are always contiguous and can be read as views without copying.
+    spare extra slots keep a view valid for that many further appends before its oldest samples are overwritten.
+
+    Appends, views and snapshots take the buffer's lock, so a snapshot is always consistent with
+    the appends made by another thread.
+    """
+    def __init__(self, capacity, channels, spare=None):
+        if capacity < 1:
+            raise ValueError(f"Ring buffer capacity must be positive, got {capacity}")
+        self.capacity = capacity
+        self.spare = max(16, capacity // 8) if spare is None else spare
+        self.slots = capacity + self.spare
+        self.lock = threading.Lock()
+        self.channel_specs = parse_channels(channels)
+        self.channels = []
+        self.widths = {}
+        self.data = {}
+        for name, dtype, width in self.channel_specs:
+            self.channels.append(name)
+            self.widths[name] = width
+            # Multi-axis channels are stored axis first, so that each axis is contiguous
+            shape = (2 * self.slots,) if width == 1 else (width, 2 * self.slots)
+            self.data[name] = np.zeros(shape, dtype=dtype)
+        self.head = 0  # Slot the next sample is written to
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def full(self):
+        return self.count == self.capacity
+
+    def clear(self):
+        with self.lock:
+            self.head = 0
+            self.count = 0
+
+    def append(self, *values):
+        """
+        Append one sample, given as one value per channel, overwriting the oldest sample if the buffer is full.
+        """
+        with self.lock:
+            head = self.head
+            mirror = head + self.slots
+            for name, value in zip(self.channels, values):
+                array = self.data[name]
+                if self.widths[name] == 1:
+                    array[head] = array[mirror] = value
+                else:
+                    array[:, head] = array[:, mirror] = value
+            self.head = (head + 1) % self.slots
+            if self.count < self.capacity:
+                self.count += 1
+
+    def start(self):
+        return (self.head - self.count) % self.slots
+
+    def view(self, name):
+        """
+        Return a view of a channel's samples, oldest first, without copying.
+        Multi-axis channels have the shape (width, samples).
+        """
+        with self.lock:
+            start = self.start()
+            return self.data[name][..., start:start + self.count]
+
+    def views(self):
+        """
+        Return views of all channels taken at the same moment.
+        """
+        with self.lock:
+            start = self.start()
+            return {name: array[..., start:start + self.count] for name, array in self.data.items()}
+
+    def snapshot(self):
+        """
+        Return copies of all channels taken at the same moment.
+        """
+        with self.lock:
+            start = self.start()
+            return {name: array[..., start:start + self.count].copy() for name, array in self.data.items()}
+
+    def row(self, index):
+        """
+        Return the sample at index, counted from the oldest and negative from the newest, as a dictionary
+        of Python values, with tuples for multi-axis channels.
+        """
+        with self.lock:
+            if not -self.count <= index < self.count:
+                raise IndexError("Ring buffer index out of range")
+            slot = self.start() + index % self.count
+            return {
+                name: array[slot].item() if self.widths[name] == 1 else tuple(array[:, slot].tolist())
+                for name, array in self.data.items()
+            }
+
+    def latest(self):
+        """
+        Return the newest sample as a dictionary, or None if the buffer is empty.
+        """
+        return self.row(-1) if self.count else None
+
+    def rows(self):
+        """
+        Return a snapshot of all samples as a list of dictionaries, oldest first.
+        """
+        return columns_to_rows(self.channel_specs, self.snapshot())
+
+class ArchiveBuffer:
+    """
+    Preallocated columnar buffer of up to capacity samples, with one typed NumPy array per channel,
+    that is filled once and then written out in bulk.
+    channels is given as for RingBuffer; multi-axis channels are stored axis first.
+    """
+    def __init__(self, capacity, channels):
+        if capacity < 1:
+            raise ValueError(f"Archive buffer capacity must be positive, got {capacity}")
+        self.capacity = capacity
+        self.channel_specs = parse_channels(channels)
+        self.data = {
+            name: np.empty((capacity,) if width == 1 else (width, capacity), dtype=dtype)
+            for name, dtype, width in self.channel_specs
+        }
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def full(self):
+        return self.count == self.capacity
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.data.values())
+
+    def clear(self):
+        self.count = 0
+
+    def append(self, *values):
+        """
+        Append one sample, given as one value per channel. Raise IndexError if the buffer is full.
+        """
+        index = self.count
+        if index >= self.capacity:
+            raise IndexError("Archive buffer is full")
+        for (name, _, width), value in zip(self.channel_specs, values):
+            if width == 1:
+                self.data[name][index] = value
+            else:
+                self.data[name][:, index] = value
+        self.count = index + 1
+
+    def columns(self):
+        """
+        Return views of the filled part of every channel.
+        """
+        return {name: array[..., :self.count] for name, array in self.data.items()}
+
+    def rows(self):
+        return columns_to_rows(self.channel_specs, self.columns())
+
+    def write_csv(self, file):
+        """
+        Write the samples to an open text file as CSV rows with write_columns_csv.
+        """
+        write_columns_csv(file, self.channel_specs, self.data, self.count)
+
+class ArchiveWriter:
+    """
+    Double-buffered archive with one long-lived writer thread.
+    Samples are appended to the active ArchiveBuffer. When it fills, or flush_interval seconds after
+    the last swap, it is swapped with the spare buffer and queued for the writer thread, which calls
+    write with it once and then returns it as the next spare. If the writer is still busy with the
+    previous buffer, a new buffer is allocated instead of waiting, so appends never block on the write.
+    append, flush and clear take the writer's lock, so another thread can flush while samples are appended.
+    """
+    def __init__(self, name, capacity, channels, write, flush_interval=None):
+        self.capacity = capacity
+        self.channels = channels
+        self.write = write
+        self.flush_interval = flush_interval
+        self.last_swap = time.monotonic()
+        self.lock = threading.Lock()
+        self.active = ArchiveBuffer(capacity, channels)
+        self.spares = queue.Queue()
+        self.spares.put(ArchiveBuffer(capacity, channels))
+        self.pending = queue.Queue()
+        self.buffers_queued = 0
+        self.buffers_done = 0  # Buffers the writer has finished with, written or not
+        self.done_condition = threading.Condition()
+        self.buffers_written = 0
+        self.thread = threading.Thread(target=self.run, name=f"{name}_writer", daemon=True)
+        self.thread.start()
+
+    def append(self, *values):
+        with self.lock:
+            self.active.append(*values)
+            if self.active.full or self.flush_interval and time.monotonic() - self.last_swap >= self.flush_interval:
+                self.swap()
+
+    def flush(self):
+        """
+        Queue the active buffer for the writer if it holds any samples.
+        """
+        with self.lock:
+            self.swap()
+
+    def clear(self):
+        """
+        Discard the samples not yet queued for the writer.
+        """
+        with self.lock:
+            self.active.clear()
+
+    def swap(self):
+        self.last_swap = time.monotonic()
+        active = self.active
+        if not len(active):
+            return
+        try:
+            self.active = self.spares.get_nowait()
+        except queue.Empty:
+            print("Archive writer is behind, allocating another buffer")
+            self.active = ArchiveBuffer(self.capacity, self.channels)
+        self.buffers_queued += 1
+        self.pending.put(active)
+
+    def wait(self):
+        """
+        Wait until every buffer queued before the call has been written.
+        """
+        with self.lock:
+            target = self.buffers_queued
+        with self.done_condition:
+            self.done_condition.wait_for(lambda: self.buffers_done >= target)
+
+    def run(self):
+        while True:
+            buffer = self.pending.get()
+            if buffer is None:  # Shutdown sentinel
+                break
+            try:
+                self.write(buffer)
+                self.buffers_written += 1
+            except Exception as e:
+                print(f"Error writing archive: {e}")
+            buffer.clear()
+            if self.spares.empty():
+                self.spares.put(buffer)  # Buffers allocated while the writer was behind are released
+            with self.done_condition:
+                self.buffers_done += 1
+                self.done_condition.notify_all()
+
+    def close(self, wait=True):
+        """
+        Stop the writer thread once the queued buffers are written. The active buffer is not written.
+        """
+        self.pending.put(None)
+        if wait:
+            self.thread.join()
@@ -1,25 +1,57 @@
-import smbus2
-from smbus2 import i2c_msg
-import serial
 import time
-import json
+import queue
+import itertools
 import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from src.utils.core_utils import handle_handshake_response
+from src.utils.framing_utils import (
+    PACKET_OVERHEAD, UART_FRAME_TEXT, I2C_ERROR_NONE, I2C_ERROR_UNKNOWN_COMMAND, I2C_ERROR_MESSAGES, decode_i2c_status, build_packet, build_uart_line, parse_uart_line, PacketBuilder, LineFramer, FrameParser
+)
+from src.utils.transport_utils import create_transports
+from src.utils.metrics_utils import TransportMetrics
+from src.utils.config_utils import load_static_config
 
-with open("/home/pi/Documents/clinostat/config/static_config.json", "r") as file:
-    static_config = json.load(file)
+# Priorities for the I2C writer queue (lower value is sent first)
+PRIORITY_SAFETY = 0
+PRIORITY_MOTOR = 1
+PRIORITY_DEFAULT = 2
+PRIORITY_LED = 3
 
-def calculate_crc16(data):
-    crc = 0xFFFF
-    for byte in data:
-        crc ^= byte << 8
-        for _ in range(8):
-            if crc & 0x8000:
-                crc = (crc << 1) ^ 0x1021
-            else:
-                crc <<= 1
-            crc &= 0xFFFF
-    return crc
+COMMAND_PRIORITIES = {
+    0x00: PRIORITY_SAFETY,  # Reset
+    0x01: PRIORITY_MOTOR,   # Motor state and speed
+    0x02: PRIORITY_LED,     # Set LEDs and show
+    0x03: PRIORITY_LED,     # Set LEDs without showing
+    0x04: PRIORITY_LED,     # Show LED strip
+    0x05: PRIORITY_DEFAULT, # Buzzer
+    0x06: PRIORITY_LED,     # Batched LED segments
+}
+
+# Time in seconds the Arduino needs to process each command before the next write
+COMMAND_PACING = {
+    0x00: 2.0,    # Reset reboots the board and replays the startup sequence
+    0x01: 0.02,   # Driver microstepping update over the TMC UART
+    0x02: 0.01,   # Pixel update plus strip.show()
+    0x03: 0.002,  # Pixel update only
+    0x04: 0.01,   # strip.show() for the full strip
+    0x05: 0.01,   # Buzzer, plus the requested duration (see command_pacing)
+    0x06: 0.005,  # Up to three pixel updates, plus strip.show() if flagged (see command_pacing)
+}
+DEFAULT_COMMAND_PACING = 0.1
+
+# Commands that carry the complete target state, so only the newest pending payload matters
+COALESCED_COMMANDS = {0x01}
+
+def command_pacing(command, payload):
+    """
+    Return the delay in seconds to leave after sending a command before the next write.
+    """
+    pacing = COMMAND_PACING.get(command, DEFAULT_COMMAND_PACING)
+    if command == 0x05 and payload:
+        pacing += payload[0] / 1000  # The buzzer blocks the firmware for the duration
+    elif command == 0x06 and payload and payload[0] & 0x01:
+        pacing += COMMAND_PACING[0x04]  # The batch ends with strip.show()
+    return pacing
 
 class Communication:
     _instance = None
@@ -29,90 +61,420 @@ class Communication:
         if not cls._instance:
             with cls._lock:
                 if not cls._instance:
-                    cls._instance = super(Communication, cls).__new__(cls, *args, **kwargs)
+                    cls._instance = super(Communication, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self, bus_id=1):
+    def __init__(self, bus_id=1, backend=None):
         if not hasattr(self, 'initialized'):  # Ensure __init__ is only called once
-            self.bus = smbus2.SMBus(bus_id)
-            self.address = static_config["i2c_address"]
-            self.serial_port = serial.Serial(
-                port=static_config["uart_port"], 
-                baudrate=static_config["baudrate"], 
-                timeout=static_config["timeout"]
-            )
+            static_config = load_static_config()
+            self.i2c_transport, self.uart_transport = create_transports(static_config, bus_id, backend)
+            self.address = static_config.i2c_address
             self.initialized = True
+            self.main_window = None
+            self.metrics = TransportMetrics()
+            self.i2c_queue = queue.PriorityQueue()
+            self.i2c_sequence = itertools.count()
+            self.packet_builder = PacketBuilder()  # Only used by the writer thread
+            self.i2c_acknowledged = static_config.i2c_acknowledged
+            self.i2c_max_retries = static_config.i2c_max_retries
+            self.i2c_busy_timeout = static_config.i2c_busy_timeout
+            self.i2c_status_sequence = None  # Sequence number of the last acknowledged packet
+            self.coalesce_lock = threading.Lock()
+            self.coalesce_interval = static_config.i2c_coalesce_interval
+            self.coalesced_pending = {}    # command -> [latest payload, future]
+            self.coalesced_last_sent = {}  # command -> last payload written to the bus
+            self.coalesced_last_time = {}  # command -> monotonic time of the last write
+            self.i2c_writer_thread = threading.Thread(target=self.process_i2c_queue)
+            self.i2c_writer_thread.daemon = True
+            self.i2c_writer_thread.start()
+            self.response_handlers = {}
+            self.binary_handlers = {}
+            self.handshake_received = threading.Event()
+            self.uart_binary_mode = False
+            self.uart_mode_request = None  # (baud rate, acknowledged event, parameters) while negotiating
+            self.uart_mode_lock = threading.Lock()  # Guards uart_mode_request and the mode switch
+            self.uart_text_baudrate = static_config.baudrate
+            self.line_framer = LineFramer(static_config.uart_buffer_size)
+            self.frame_parser = FrameParser(static_config.uart_buffer_size)
+            self.handler_pool = ThreadPoolExecutor(
+                max_workers=static_config.uart_handler_workers, thread_name_prefix="uart_handler"
+            )
             self.listener_thread = threading.Thread(target=self.listen_for_response)
             self.listener_thread.daemon = True
             self.listener_thread_running = True
             self.listener_thread.start()
-            self.response_handlers = {}
+            if static_config.metrics_snapshot_path:
+                self.metrics.start_snapshot_writer(
+                    static_config.metrics_snapshot_path, static_config.metrics_snapshot_interval
+                )
 
-    def send_i2c_command(self, command, payload):
-        packet = [0xFF, len(payload) + 1, command] + payload
-        crc = calculate_crc16(packet)
-        packet.append((crc >> 8) & 0xFF)
-        packet.append(crc & 0xFF)
-        try:
-            write = i2c_msg.write(self.address, packet)
-            self.bus.i2c_rdwr(write)
-            time.sleep(0.1)
-        except Exception as e:
-            print(f"I2C Error: {e}")
-            if hasattr(self, 'main_window') and self.main_window:
-                self.main_window.i2c_communication_error.emit()  # Emit the error signal
-                print("I2C communication error emitted.")
+    def send_i2c_command(self, command, payload, priority=None):
+        """
+        Queue an I2C command for the writer thread and return a Future for its completion.
+        Commands with the same priority are sent in the order they were queued.
+        """
+        if priority is None:
+            priority = COMMAND_PRIORITIES.get(command, PRIORITY_DEFAULT)
+        if command in COALESCED_COMMANDS:
+            return self.queue_coalesced_i2c_command(command, bytes(payload), priority)
+        future = Future()
+        self.i2c_queue.put((priority, next(self.i2c_sequence), command, bytes(payload), future, time.monotonic()))
+        self.metrics.record_queue_depth(self.i2c_queue.qsize())
+        return future
+
+    def queue_coalesced_i2c_command(self, command, payload, priority):
+        """
+        Queue a command that supersedes any pending command of the same type.
+        Only the newest payload is written, identical consecutive payloads are dropped and
+        writes are limited to i2c_coalesce_max_rate per second.
+        Every caller whose command is still pending shares one Future, so cancelling it cancels
+        the pending command for all of them.
+        """
+        with self.coalesce_lock:
+            pending = self.coalesced_pending.get(command)
+            if pending is not None and not pending[1].cancelled():
+                pending[0] = payload  # Latest wins, the queued entry picks it up when written
+                self.metrics.record_coalesced()
+                return pending[1]
+
+            future = Future()
+            if self.coalesced_last_sent.get(command) == payload:
+                future.set_result(True)
+                self.metrics.record_coalesced()
+                return future
+
+            self.coalesced_pending[command] = [payload, future]
+            delay = self.coalesced_last_time.get(command, 0) + self.coalesce_interval - time.monotonic()
+
+        # The payload is resolved by the writer thread, so the queue entry carries None
+        entry = (priority, next(self.i2c_sequence), command, None, future, time.monotonic())
+        if delay > 0:
+            timer = threading.Timer(delay, self.i2c_queue.put, args=(entry,))
+            timer.daemon = True
+            timer.start()
+        else:
+            self.i2c_queue.put(entry)
+        return future
+
+    def take_coalesced_payload(self, command):
+        """
+        Remove and return the newest pending payload for a coalesced command,
+        or None if it matches the last payload written.
+        """
+        with self.coalesce_lock:
+            payload = self.coalesced_pending.pop(command)[0]
+            if self.coalesced_last_sent.get(command) == payload:
+                return None
+            self.coalesced_last_time[command] = time.monotonic()
+            return payload
+
+    def discard_coalesced_payload(self, command, future):
+        """
+        Remove the pending entry of a cancelled coalesced command, unless a newer entry has replaced it.
+        """
+        with self.coalesce_lock:
+            pending = self.coalesced_pending.get(command)
+            if pending is not None and pending[1] is future:
+                del self.coalesced_pending[command]
+
+    def process_i2c_queue(self):
+        """
+        Write queued I2C commands to the bus, pacing each one for the Arduino to process it.
+        """
+        while True:
+            priority, sequence, command, payload, future, queued_at = self.i2c_queue.get()
+            if future is None:  # Shutdown sentinel
+                break
+            self.metrics.record_queue_depth(self.i2c_queue.qsize())
+            if not future.set_running_or_notify_cancel():
+                if payload is None:
+                    self.discard_coalesced_payload(command, future)
+                continue
+            if payload is None:
+                payload = self.take_coalesced_payload(command)
+                if payload is None:
+                    future.set_result(True)
+                    self.metrics.record_coalesced()
+                    continue
+            acknowledged = False
+            success = False
+            started_at = time.monotonic()
+            try:
+                acknowledged = self.write_i2c_packet(command, payload)
+                success = True
+                if command == 0x00:
+                    # The Arduino forgets its state on reset, so nothing may be skipped as a duplicate
+                    with self.coalesce_lock:
+                        self.coalesced_last_sent.clear()
+                elif command in COALESCED_COMMANDS:
+                    with self.coalesce_lock:
+                        self.coalesced_last_sent[command] = payload
+                future.set_result(True)
+            except Exception as e:
+                print(f"I2C Error: {e}")
+                with self.coalesce_lock:
+                    self.coalesced_last_sent.pop(command, None)  # Allow the same payload to be retried
+                future.set_exception(e)
+                if self.main_window:
+                    self.main_window.i2c_communication_error.emit()  # Emit the error signal
+                    print("I2C communication error emitted.")
+            finished_at = time.monotonic()
+            pacing = 0.0 if acknowledged else command_pacing(command, payload)
+            self.metrics.record_i2c_send(
+                command, queued_at, started_at, finished_at, len(payload) + PACKET_OVERHEAD, success, pacing
+            )
+            if pacing:
+                time.sleep(pacing)
+
+    def write_i2c_packet(self, command, payload):
+        """
+        Frame the command and payload and write the packet to the bus.
+        With i2c_acknowledged set, each packet is followed by a status read in the same transaction
+        and resent if the Arduino did not receive it intact. Return True if the packet was acknowledged.
+        """
+        packet = self.packet_builder.build(command, payload)
+        if not self.i2c_acknowledged or command == 0x00:
+            # A reset reboots the Arduino before it can answer
+            self.i2c_transport.write(self.address, packet)
+            if command == 0x00:
+                self.i2c_status_sequence = None
+            return False
+
+        for attempt in range(self.i2c_max_retries + 1):
+            sequence, error_code, busy = decode_i2c_status(self.i2c_transport.write_read(self.address, packet, 1)[0])
+            deadline = time.monotonic() + self.i2c_busy_timeout
+            while busy and time.monotonic() < deadline:
+                time.sleep(0.001)
+                sequence, error_code, busy = decode_i2c_status(self.i2c_transport.read(self.address, 1)[0])
+
+            received = self.i2c_status_sequence is None or sequence != self.i2c_status_sequence
+            self.i2c_status_sequence = sequence
+            if received and error_code == I2C_ERROR_NONE:
+                return True
+
+            reason = I2C_ERROR_MESSAGES.get(error_code, f"error {error_code}") if received else "Packet not received"
+            if error_code == I2C_ERROR_UNKNOWN_COMMAND:
+                raise IOError(f"I2C command 0x{command:02X} rejected: {reason}")  # Resending cannot help
+            print(f"I2C command 0x{command:02X} failed: {reason} (attempt {attempt + 1}/{self.i2c_max_retries + 1})")
+            if attempt < self.i2c_max_retries:
+                self.metrics.record_i2c_retry()
+        raise IOError(f"I2C command 0x{command:02X} not acknowledged after {self.i2c_max_retries + 1} attempts")
 
     def send_uart_data(self, data):
         try:
-            self.serial_port.write(data.encode())
+            data = data.encode()
+            self.uart_transport.write(data)
+            self.metrics.record_uart_sent(len(data))
         except Exception as e:
             print(f"UART Error: {e}")
 
-    def read_uart_data(self):
+    def send_uart_message(self, message):
+        """
+        Send a message in the active UART protocol: "<message>,CRC=XXXX" in text mode or a text frame in binary mode.
+        """
+        if self.uart_binary_mode:
+            self.send_uart_frame(UART_FRAME_TEXT, message.encode('utf-8'))
+        else:
+            self.send_uart_data(build_uart_line(message))
+
+    def send_uart_frame(self, frame_type, payload):
         try:
-            data = self.serial_port.readline().decode('utf-8', errors='ignore').strip()
-            return data
+            frame = build_packet(frame_type, payload)
+            self.uart_transport.write(frame)
+            self.metrics.record_uart_sent(len(frame))
         except Exception as e:
-            print(f"UART Read Error: {e}")
-            return ""
+            print(f"UART Error: {e}")
+
+    def negotiate_binary_mode(self, baudrate, handshake_timeout=10, ack_timeout=2):
+        """
+        Ask the UART peer to switch to binary framing at the given baud rate once the handshake has completed.
+        Return True if the peer acknowledged, otherwise the text protocol stays in use.
+
+        Contract with the peer: "UART_MODE,BINARY=1,BAUD=<baud>" is answered with a text
+        "UART_MODE_ACK,BINARY=1,BAUD=<baud>" line, after which both sides use binary frames at that baud rate.
+        "UART_MODE,BINARY=0,BAUD=<baud>" sent as a binary text frame returns the peer to the text protocol
+        at that baud rate and is not answered. If the ACK is lost, corrupted or late, the host cannot tell
+        whether the peer switched, so it sends the revert at the requested baud rate and stays in text mode.
+        """
+        if not self.handshake_received.wait(handshake_timeout):
+            print("No handshake received, staying in UART text mode.")
+            return False
+
+        acknowledged = threading.Event()
+        parameters = {}
+        # The listener thread switches modes as soon as the ACK line arrives (see switch_to_binary_mode)
+        with self.uart_mode_lock:
+            self.uart_mode_request = (baudrate, acknowledged, parameters)
+        self.send_uart_message(f"UART_MODE,BINARY=1,BAUD={baudrate}")
+        acknowledged.wait(ack_timeout)
+        with self.uart_mode_lock:
+            # From here on a late ACK is ignored by the listener
+            self.uart_mode_request = None
+            switched = self.uart_binary_mode
+            if not switched:
+                self.revert_peer_to_text_mode(baudrate)
+        if not switched:
+            print("UART peer does not support binary mode, staying in UART text mode.")
+            return False
+
+        print(f"UART switched to binary mode at {parameters.get('BAUD', baudrate)} baud.")
+        return True
+
+    def switch_to_binary_mode(self, response_data):
+        """
+        Handle a UART_MODE_ACK line in the listener thread. If the peer accepted binary mode, switch
+        the baud rate and framing before any more bytes are parsed. Return True if the mode was switched.
+        """
+        with self.uart_mode_lock:
+            request = self.uart_mode_request
+            if request is None:
+                return False
+            baudrate, acknowledged, parameters = request
+            parameters.update(field.split('=', 1) for field in response_data.split(',')[1:] if '=' in field)
+            switched = parameters.get("BINARY") == "1"
+            if switched:
+                self.uart_transport.set_baudrate(int(parameters.get("BAUD", baudrate)))
+                self.uart_binary_mode = True
+            acknowledged.set()
+        return switched
+
+    def revert_peer_to_text_mode(self, baudrate):
+        """
+        Send the binary-mode revert at the given baud rate, in case the peer switched without the
+        host seeing its ACK, and return to the text baud rate. A peer still in text mode ignores it.
+        """
+        self.uart_transport.set_baudrate(baudrate)
+        self.send_uart_frame(UART_FRAME_TEXT, f"UART_MODE,BINARY=0,BAUD={self.uart_text_baudrate}".encode('utf-8'))
+        self.uart_transport.set_baudrate(self.uart_text_baudrate)
 
     def listen_for_response(self):
-        start_time = time.time()
-        while self.listener_thread_running and (time.time() - start_time < 10):
+        """
+        Receive UART data for the lifetime of the process.
+        Available bytes are framed into lines, validated and dispatched to the handler pool,
+        so slow handlers never hold up reception.
+        """
+        start_time = time.monotonic()
+        while self.listener_thread_running:
             try:
-                response = self.read_uart_data()
-                if response:
-                    received_data, received_crc = response.rsplit(',', 1)
-                    received_crc = int(received_crc.split('=')[1], 16)
-                    calculated_crc = calculate_crc16(received_data.encode('utf-8'))
-                    if calculated_crc == received_crc:
-                        print("CRC validation successful.")
-                        response_type = received_data.split(',')[0]
-                        if response_type in self.response_handlers:
-                            self.response_handlers[response_type](received_data)
-                            if response_type == "HANDSHAKE_RESPONSE":
-                                self.listener_thread_running = False  # Stop the listener thread
-                        else:
-                            print(f"No handler for response type: {response_type}")
-                    else:
-                        print("CRC mismatch. Data may be corrupted.")
-                else:
-                    print("No response received.")
+                data = self.uart_transport.read_available()
             except Exception as e:
-                print(f"Error processing response: {e}")
-        if time.time() - start_time >= 10:
-            print("UART connection not established.")
+                print(f"UART Read Error: {e}")
+                time.sleep(1)
+                continue
+
+            if data:
+                self.metrics.record_uart_received(len(data))
+            if data and self.uart_binary_mode:
+                self.feed_frames(data)
+            elif data:
+                self.line_framer.write(data)
+                self.dispatch_responses()
+            elif not self.handshake_received.is_set() and start_time is not None and time.monotonic() - start_time >= 10:
+                print("UART connection not established.")
+                start_time = None  # Only warn once
+
+    def feed_frames(self, data):
+        crc_errors = self.frame_parser.crc_errors
+        self.dispatch_frames(self.frame_parser.feed(data))
+        if self.frame_parser.crc_errors != crc_errors:
+            self.metrics.record_uart_crc_mismatch(self.frame_parser.crc_errors - crc_errors)
+
+    def dispatch_responses(self):
+        """
+        Validate the received lines and submit each message to its handler.
+        If a line switches the UART to binary mode, the bytes after it are parsed as binary frames.
+        """
+        while True:
+            line = self.line_framer.read_line()
+            if line is None:
+                return
+            received_data, crc_valid = parse_uart_line(line)
+            if received_data is None:
+                print(f"Malformed UART line: {line!r}")
+                self.metrics.record_uart_malformed()
+                continue
+            if not crc_valid:
+                print("CRC mismatch. Data may be corrupted.")
+                self.metrics.record_uart_crc_mismatch()
+                continue
+            if received_data.split(',')[0] == "UART_MODE_ACK":
+                self.metrics.record_uart_message()
+                if self.switch_to_binary_mode(received_data):
+                    remaining = self.line_framer.take_remaining()
+                    if remaining:
+                        self.feed_frames(remaining)
+                    return
+                continue
+            self.dispatch_message(received_data)
+
+    def dispatch_frames(self, frames):
+        """
+        Submit each binary frame to its handler. Text frames go through the text message handlers.
+        """
+        for frame_type, payload in frames:
+            if frame_type == UART_FRAME_TEXT:
+                self.dispatch_message(payload.decode('utf-8', errors='ignore'))
+                continue
+            handler = self.binary_handlers.get(frame_type)
+            if handler:
+                self.handler_pool.submit(self.run_response_handler, handler, f"0x{frame_type:02X}", payload)
+            else:
+                print(f"No handler for frame type: 0x{frame_type:02X}")
+
+    def dispatch_message(self, received_data):
+        self.metrics.record_uart_message()
+        response_type = received_data.split(',')[0]
+        if response_type == "HANDSHAKE_RESPONSE":
+            self.handshake_received.set()
+        handler = self.response_handlers.get(response_type)
+        if handler:
+            self.handler_pool.submit(self.run_response_handler, handler, response_type, received_data)
+        else:
+            print(f"No handler for response type: {response_type}")
+
+    def run_response_handler(self, handler, response_type, received_data):
+        try:
+            handler(received_data)
+        except Exception as e:
+            print(f"Error processing {response_type} response: {e}")
 
     def add_response_handler(self, response_type, handler):
         self.response_handlers[response_type] = handler
 
+    def get_metrics(self):
+        """
+        Return a snapshot of the I2C and UART transport metrics.
+        """
+        return self.metrics.snapshot()
+
+    def add_binary_handler(self, frame_type, handler):
+        """
+        Register a handler called with the payload bytes of binary frames of the given type.
+        """
+        self.binary_handlers[frame_type] = handler
+
     def close(self):
+        # The sentinel sorts after every queued command, so pending writes are flushed first
+        self.i2c_queue.put((float("inf"), next(self.i2c_sequence), None, None, None, time.monotonic()))
+        self.i2c_writer_thread.join()
         self.listener_thread_running = False
         self.listener_thread.join()
-        self.serial_port.close()
-        self.bus.close()
+        self.handler_pool.shutdown(wait=False)
+        self.uart_transport.close()
+        self.i2c_transport.close()
+
+_communication = None
+_communication_lock = threading.Lock()
 
-# Create a single instance of the Communication class
-communication = Communication()
-communication.add_response_handler("HANDSHAKE_RESPONSE", handle_handshake_response)
+def get_communication():
+    """
+    Return the shared Communication instance, opening the I2C bus and UART on the first call.
+    """
+    global _communication
+    if _communication is None:
+        with _communication_lock:
+            if _communication is None:
+                communication = Communication()
+                communication.add_response_handler("HANDSHAKE_RESPONSE", handle_handshake_response)
+                _communication = communication
+    return _communication
@@ -0,0 +1,259 @@
+import os
+import copy
+import json
+import atexit
+import threading
+import dataclasses
+from dataclasses import dataclass, field, fields
+from types import MappingProxyType
+
+# Define the constant path to the static configuration file
+STATIC_CONFIG_PATH = "/home/pi/Documents/clinostat/config/static_config.json"
+
+REQUIRED = dataclasses.MISSING
+
+@dataclass(frozen=True)
+class MotorSettings:
+    motor_steps: int
+    gear_ratio: int
+    microstepping_options: tuple
+    steps_per_rotation: int = field(init=False)  # Full steps per output rotation, before microstepping
+
+    def __post_init__(self):
+        options = tuple(sorted(self.microstepping_options))
+        if not options or any(option < 1 or option & (option - 1) for option in options):
+            raise ValueError(f"microstepping_options must be powers of two, got {self.microstepping_options}")
+        object.__setattr__(self, "microstepping_options", options)
+        object.__setattr__(self, "steps_per_rotation", self.motor_steps * self.gear_ratio)
+
+@dataclass(frozen=True)
+class LedSettings:
+    default_start_led: int
+    default_end_led: int
+    default_red: int
+    default_green: int
+    default_blue: int
+    default_white: int
+    default_brightness: int
+    default_command: dict = field(init=False)  # In the format saved by save_LED_command
+
+    def __post_init__(self):
+        if not 1 <= self.default_start_led <= self.default_end_led:
+            raise ValueError(f"Invalid default LED range {self.default_start_led}-{self.default_end_led}")
+        for name in ("default_red", "default_green", "default_blue", "default_white", "default_brightness"):
+            if not 0 <= getattr(self, name) <= 255:
+                raise ValueError(f"{name} must be between 0 and 255")
+        object.__setattr__(self, "default_command", MappingProxyType({
+            "start_led": self.default_start_led,
+            "end_led": self.default_end_led,
+            "red": self.default_red,
+            "green": self.default_green,
+            "blue": self.default_blue,
+            "white": self.default_white,
+            "brightness": self.default_brightness,
+        }))
+
+@dataclass(frozen=True)
+class SimulatorLatency:
+    i2c_clock_hz: int = 100000
+    time_scale: float = 1.0
+
+@dataclass(frozen=True)
+class StaticConfig:
+    """
+    Validated, immutable contents of static_config.json. Keys missing from the file take the defaults below.
+    """
+    i2c_address: int
+    uart_port: str
+    baudrate: int
+    timeout: float
+    core_ip_address: str
+    ambient_sensor_address: int
+    motion_sensor_address: int
+    motor_settings: MotorSettings
+    led_settings: LedSettings
+    max_ambient_recent_data_points: int
+    max_ambient_archived_data_points: int
+    max_motion_recent_data_points: int
+    max_motion_archived_data_points: int
+    i2c_coalesce_max_rate: float = 10
+    i2c_acknowledged: bool = False
+    i2c_max_retries: int = 3
+    i2c_busy_timeout: float = 0.5
+    uart_buffer_size: int = 4096
+    uart_handler_workers: int = 2
+    uart_binary_mode: bool = False
+    uart_binary_baudrate: int = 115200
+    metrics_snapshot_path: str = None
+    metrics_snapshot_interval: float = 60
+    transport: str = "hardware"
+    simulator_latency: SimulatorLatency = SimulatorLatency()
+    rotation_estimate_window: float = 10
+    gyro_core_axis: int = 1
+    critical_storage_value: int = 500  # MB
+    dynamic_config_write_delay: float = 1.0
+    led_journal_compact_threshold: int = 64
+    led_preset_cache_size: int = 16
+    sensor_log_flush_interval: float = 60
+    sensor_log_retention: int = 10  # Sensor logs kept per stream
+    imaging_timeout: float = 20
+    i2c_coalesce_interval: float = field(init=False)
+    core_base_url: str = field(init=False)
+
+    def __post_init__(self):
+        if not 0 <= self.i2c_address <= 0x7F:
+            raise ValueError(f"i2c_address must be a 7-bit address, got {self.i2c_address}")
+        if self.i2c_coalesce_max_rate <= 0:
+            raise ValueError("i2c_coalesce_max_rate must be positive")
+        if self.transport not in ("hardware", "simulator"):
+            raise ValueError(f"Unknown transport backend: {self.transport}")
+        if self.sensor_log_retention < 1:
+            raise ValueError("sensor_log_retention must be at least 1")
+        if self.gyro_core_axis not in (0, 1, 2):
+            raise ValueError("gyro_core_axis must be 0, 1 or 2")
+        object.__setattr__(self, "i2c_coalesce_interval", 1 / self.i2c_coalesce_max_rate)
+        object.__setattr__(self, "core_base_url", f"http://{self.core_ip_address}:5000")
+
+def _check_type(name, value, expected):
+    if expected is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if expected is tuple and isinstance(value, list):
+        return tuple(value)
+    if expected is int and isinstance(value, bool) or not isinstance(value, expected):
+        raise ValueError(f"Static configuration key {name} must be of type {expected.__name__}, got {value!r}")
+    return value
+
+def config_from_dict(cls, values, prefix=""):
+    """
+    Build the dataclass cls from a dictionary, converting nested dictionaries and checking the value types.
+    Unknown keys are reported and ignored.
+    """
+    arguments = {}
+    init_fields = [item for item in fields(cls) if item.init]
+    for item in init_fields:
+        name = prefix + item.name
+        if item.name not in values:
+            if item.default is REQUIRED:
+                raise ValueError(f"Static configuration key {name} is missing")
+            continue
+        value = values[item.name]
+        if dataclasses.is_dataclass(item.type):
+            if not isinstance(value, dict):
+                raise ValueError(f"Static configuration key {name} must be an object")
+            value = config_from_dict(item.type, value, f"{name}.")
+        elif not (value is None and item.default is None):
+            value = _check_type(name, value, item.type)
+        arguments[item.name] = value
+    for key in set(values) - {item.name for item in init_fields}:
+        print(f"Unknown static configuration key: {prefix}{key}")
+    return cls(**arguments)
+
+_static_config = None
+_static_config_lock = threading.Lock()
+
+def load_static_config():
+    """
+    Return the StaticConfig for the static configuration file.
+    The file is parsed and validated on the first call and the same object is shared afterwards.
+    """
+    global _static_config
+    if _static_config is None:
+        with _static_config_lock:
+            if _static_config is None:
+                if not os.path.exists(STATIC_CONFIG_PATH):
+                    raise FileNotFoundError(f"Static configuration file not found: {STATIC_CONFIG_PATH}")
+                with open(STATIC_CONFIG_PATH, "r") as file:
+                    _static_config = config_from_dict(StaticConfig, json.load(file))
+    return _static_config
+
+# Define the constant path to the dynamic configuration file
+DYNAMIC_CONFIG_PATH = "/home/pi/Documents/clinostat/config/dynamic_config.json"
+
+class DynamicConfigStore:
+    """
+    In-memory copy of the dynamic configuration with write-behind to the JSON file.
+    A save marks the configuration dirty and schedules a write after write_delay seconds, so a burst
+    of saves results in one write. Writes go to a temporary file that is renamed over the original,
+    so the file is never left half written.
+    """
+    def __init__(self, path, write_delay=1.0):
+        self.path = path
+        self.write_delay = write_delay
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.config = None
+        self.dirty = False
+        self.timer = None
+        self.exit_flush_registered = False
+
+    def load(self):
+        """
+        Return a copy of the configuration, reading the file on the first call.
+        """
+        with self.lock:
+            if self.config is None:
+                self.config = self.read_file()
+            return copy.deepcopy(self.config)
+
+    def read_file(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r") as file:
+                return json.load(file)
+        return {}
+
+    def save(self, config):
+        """
+        Replace the configuration and schedule a write if it changed.
+        """
+        with self.lock:
+            if config == self.config:
+                return
+            self.config = copy.deepcopy(config)
+            self.dirty = True
+            if self.timer is None:
+                self.timer = threading.Timer(self.write_delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+            if not self.exit_flush_registered:
+                atexit.register(self.flush)
+                self.exit_flush_registered = True
+
+    def flush(self):
+        """
+        Write the configuration to the file now if it has unsaved changes.
+        """
+        with self.write_lock:
+            with self.lock:
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+                if not self.dirty:
+                    return
+                config = copy.deepcopy(self.config)
+                self.dirty = False
+            try:
+                temp_path = f"{self.path}.tmp"
+                with open(temp_path, "w") as file:
+                    json.dump(config, file, indent=4)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                print(f"Error writing dynamic configuration: {e}")
+                with self.lock:
+                    self.dirty = True  # Retry on the next flush
+
+_dynamic_config_store = None
+_dynamic_config_store_lock = threading.Lock()
+
+def get_dynamic_config_store():
+    """
+    Return the shared DynamicConfigStore.
+    """
+    global _dynamic_config_store
+    if _dynamic_config_store is None:
+        write_delay = load_static_config().dynamic_config_write_delay
+        with _dynamic_config_store_lock:
+            if _dynamic_config_store is None:
+                _dynamic_config_store = DynamicConfigStore(DYNAMIC_CONFIG_PATH, write_delay)
+    return _dynamic_config_store
@@ -0,0 +1,271 @@
+START_BYTE = 0xFF
+PACKET_MAX_SIZE = 32
+PACKET_OVERHEAD = 5  # Start byte, length, command and two CRC bytes
+NUM_LEDS = 130  # Length of the strip in neo_controls_v2.03.ino
+
+# I2C status byte returned by the Arduino after each packet: busy flag, 3-bit error code, 4-bit sequence number
+I2C_STATUS_BUSY = 0x80
+I2C_ERROR_NONE = 0
+I2C_ERROR_UNKNOWN_COMMAND = 6
+I2C_ERROR_MESSAGES = {
+    1: "Packet too short",
+    2: "Packet too long",
+    3: "Invalid start byte",
+    4: "Length mismatch",
+    5: "CRC mismatch",
+    I2C_ERROR_UNKNOWN_COMMAND: "Unknown command",
+}
+
+def decode_i2c_status(status):
+    """
+    Split an I2C status byte into (sequence, error_code, busy).
+    """
+    return status & 0x0F, (status >> 4) & 0x07, bool(status & I2C_STATUS_BUSY)
+
+def encode_i2c_status(sequence, error_code, busy):
+    return (I2C_STATUS_BUSY if busy else 0) | ((error_code & 0x07) << 4) | (sequence & 0x0F)
+
+# Binary UART frame types
+UART_FRAME_TEXT = 0x01  # A text protocol message without the CRC suffix
+
+def _make_crc16_table():
+    """
+    Precompute the CRC-CCITT (polynomial 0x1021) value for every byte.
+    """
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+        table.append(crc)
+    return tuple(table)
+
+CRC16_TABLE = _make_crc16_table()
+
+def calculate_crc16(data, crc=0xFFFF):
+    """
+    Calculate the CRC-CCITT of bytes, a bytearray, a memoryview or a list of ints.
+    Pass the previous result as crc to continue the calculation over another chunk.
+    """
+    table = CRC16_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ table[(crc >> 8) ^ byte]
+    return crc
+
+def encode_motor_state(enabled, sps, microstepping, direction_cw):
+    """
+    Encode one motor's 6-byte block of the 0x01 payload: enabled, sps * 1000 (24 bit), log2 microstepping, direction.
+    """
+    sps_raw = int(sps * 1000)
+    return bytes((
+        int(enabled),
+        (sps_raw >> 16) & 0xFF,
+        (sps_raw >> 8) & 0xFF,
+        sps_raw & 0xFF,
+        int(microstepping).bit_length() - 1,
+        int(direction_cw),
+    ))
+
+class PacketBuilder:
+    """
+    Build packets in a preallocated buffer without intermediate lists.
+    The returned memoryview is only valid until the next call to build.
+    """
+    def __init__(self, size=PACKET_MAX_SIZE):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+
+    def build(self, command, payload):
+        payload_length = len(payload)
+        end = payload_length + 3
+        if end + 2 > len(self.buffer):
+            raise ValueError(f"Payload of {payload_length} bytes does not fit in a {len(self.buffer)} byte packet")
+        buffer = self.buffer
+        buffer[0] = START_BYTE
+        buffer[1] = payload_length + 1
+        buffer[2] = command
+        buffer[3:end] = payload
+        crc = calculate_crc16(self.view[:end])
+        buffer[end] = crc >> 8
+        buffer[end + 1] = crc & 0xFF
+        return self.view[:end + 2]
+
+def build_packet(command, payload):
+    """
+    Frame a command and payload as START_BYTE, length, command, payload, CRC16 (big endian).
+    """
+    return bytes(PacketBuilder(len(payload) + PACKET_OVERHEAD).build(command, payload))
+
+class RingBuffer:
+    """
+    Fixed-capacity byte ring buffer. When full, the oldest bytes are dropped and counted in overflow_bytes.
+    """
+    def __init__(self, capacity=4096):
+        self.buffer = bytearray(capacity)
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        self.overflow_bytes = 0
+
+    def write(self, data):
+        data = memoryview(data)
+        if len(data) > self.capacity:
+            self.overflow_bytes += len(data) - self.capacity
+            data = data[-self.capacity:]
+        excess = self.size + len(data) - self.capacity
+        if excess > 0:
+            self.discard(excess)
+            self.overflow_bytes += excess
+        end = (self.start + self.size) % self.capacity
+        first = min(len(data), self.capacity - end)
+        self.buffer[end:end + first] = data[:first]
+        self.buffer[:len(data) - first] = data[first:]
+        self.size += len(data)
+
+    def find(self, byte, offset=0):
+        """
+        Return the offset of the first occurrence of byte at or after offset, or -1.
+        """
+        if offset >= self.size:
+            return -1
+        position = self.start + offset
+        end = self.start + self.size
+        if position < self.capacity:
+            index = self.buffer.find(byte, position, min(end, self.capacity))
+            if index >= 0:
+                return index - self.start
+            position = self.capacity
+        if end > self.capacity:
+            index = self.buffer.find(byte, position - self.capacity, end - self.capacity)
+            if index >= 0:
+                return index + self.capacity - self.start
+        return -1
+
+    def peek(self, count):
+        """
+        Return the first count bytes without consuming them.
+        """
+        count = min(count, self.size)
+        first = min(count, self.capacity - self.start)
+        return bytes(self.buffer[self.start:self.start + first]) + bytes(self.buffer[:count - first])
+
+    def read(self, count):
+        count = min(count, self.size)
+        data = self.peek(count)
+        self.discard(count)
+        return data
+
+    def discard(self, count):
+        count = min(count, self.size)
+        self.start = (self.start + count) % self.capacity
+        self.size -= count
+
+class LineFramer:
+    """
+    Split a UART byte stream into lines incrementally.
+    Bytes already scanned for a newline are not scanned again when more data arrives.
+    """
+    def __init__(self, capacity=4096):
+        self.ring = RingBuffer(capacity)
+        self.scanned = 0
+
+    def feed(self, data):
+        """
+        Add received bytes and return the complete lines, without line endings or empty lines.
+        """
+        self.write(data)
+        lines = []
+        while True:
+            line = self.read_line()
+            if line is None:
+                return lines
+            lines.append(line)
+
+    def write(self, data):
+        overflow_before = self.ring.overflow_bytes
+        self.ring.write(data)
+        if self.ring.overflow_bytes != overflow_before:
+            self.scanned = 0  # The start of the buffer moved, rescan what is left
+
+    def read_line(self):
+        """
+        Remove and return the next complete non-empty line without its line ending, or None if there is none.
+        """
+        while True:
+            index = self.ring.find(b"\n", self.scanned)
+            if index < 0:
+                self.scanned = self.ring.size
+                return None
+            line = self.ring.read(index + 1).strip()
+            self.scanned = 0
+            if line:
+                return line
+
+    def take_remaining(self):
+        """
+        Remove and return the bytes after the last complete line.
+        """
+        self.scanned = 0
+        return self.ring.read(self.ring.size)
+
+class FrameParser:
+    """
+    Extract START_BYTE/length/type/payload/CRC16 frames from a byte stream.
+    On a bad length or CRC the parser skips one byte and resynchronises on the next start byte.
+    """
+    def __init__(self, capacity=4096):
+        self.ring = RingBuffer(capacity)
+        self.crc_errors = 0
+
+    def feed(self, data):
+        """
+        Add received bytes and return the complete valid frames as (type, payload) tuples.
+        """
+        self.ring.write(data)
+        frames = []
+        while True:
+            start = self.ring.find(b"\xff")
+            if start < 0:
+                self.ring.discard(self.ring.size)
+                return frames
+            self.ring.discard(start)
+            if self.ring.size < 2:
+                return frames
+            length = self.ring.peek(2)[1]
+            if length < 1:
+                self.ring.discard(1)
+                continue
+            frame_size = length + 4
+            if self.ring.size < frame_size:
+                return frames
+            frame = self.ring.peek(frame_size)
+            if calculate_crc16(frame[:-2]) != (frame[-2] << 8) | frame[-1]:
+                self.crc_errors += 1
+                self.ring.discard(1)
+                continue
+            self.ring.discard(frame_size)
+            frames.append((frame[2], frame[3:-2]))
+
+def build_uart_line(text):
+    """
+    Append the text protocol CRC suffix to a message: "<text>,CRC=XXXX".
+    """
+    crc = calculate_crc16(text.encode('utf-8'))
+    return f"{text},CRC={crc:04X}"
+
+def parse_uart_line(line):
+    """
+    Split a text protocol line "<data>,CRC=XXXX" into (data, crc_valid).
+    Return (None, False) if the line is not in that format.
+    """
+    data, separator, crc_field = line.rpartition(b",")
+    if not separator or not crc_field.startswith(b"CRC="):
+        return None, False
+    try:
+        received_crc = int(crc_field[4:], 16)
+    except ValueError:
+        return None, False
+    return data.decode('utf-8', errors='ignore'), calculate_crc16(data) == received_crc
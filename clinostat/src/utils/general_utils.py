@@ -1,47 +1,28 @@
-import os
 import json
 import shutil
 from PyQt5.QtWidgets import QFileDialog, QMessageBox
 from PyQt5.QtCore import QStandardPaths
 from src.utils.runtime_state import runtime_state
 import src.ui.updater.general_ui_updater as general_ui_updater
+from src.utils.config_utils import load_static_config, get_dynamic_config_store
 
-# Define the constant path to the motion configuration file
-DYNAMIC_CONFIG_PATH = "/home/pi/Documents/clinostat/config/dynamic_config.json"
-
-# Define the constant path to the static configuration file
-STATIC_CONFIG_PATH = "/home/pi/Documents/clinostat/config/static_config.json"
-
-def load_static_config():
+def load_dynamic_config():
     """
-    Load the static configuration from the JSON file.
+    Load the dynamic configuration from the in-memory store.
     """
-    if os.path.exists(STATIC_CONFIG_PATH):
-        with open(STATIC_CONFIG_PATH, "r") as file:
-            config = json.load(file)
-        return config
-    else:
-        raise FileNotFoundError(f"Static configuration file not found: {STATIC_CONFIG_PATH}")
+    return get_dynamic_config_store().load()
 
-def load_dynamic_config():
+def save_dynamic_config(config):
     """
-    Load the dynamic configuration from the JSON file.
+    Save the dynamic configuration. The file is written in the background shortly afterwards.
     """
-    if os.path.exists(DYNAMIC_CONFIG_PATH):
-        with open(DYNAMIC_CONFIG_PATH, "r") as file:
-            config = json.load(file)
-        return config
-    else:
-        return {}
+    get_dynamic_config_store().save(config)
 
-def save_dynamic_config(config):
+def flush_dynamic_config():
     """
-    Save the dynamic configuration to the JSON file.
+    Write pending dynamic configuration changes to the file now.
     """
-    with open(DYNAMIC_CONFIG_PATH, "w") as file:
-        json.dump(config, file, indent=4)
-    
-    print(config)
+    get_dynamic_config_store().flush()
 
 def update_runtime_state_from_config(config):
     runtime_state.set_motor_speed(1, config.get("frame_motor_speed", 1.00))
@@ -71,9 +52,15 @@ def open_file_dialog(main_window, file_filter="All Files (*)", mode="open"):
     elif mode == "save":
         file_name, _ = QFileDialog.getSaveFileName(main_window, "Save File", save_directory, file_filter, options=options)
         if file_name:
+            from src.utils.lighting_utils import get_LED_commands
+            from src.utils.preset_utils import get_preset_library
             try:
                 with open(file_name, 'w') as file:
                     config = load_dynamic_config()
+                    config["led_commands"] = get_LED_commands()
+                    config.pop("led_journal_generation", None)
+                    library = get_preset_library()
+                    config["led_presets"] = {name: library.get_commands(name) for name in library.names()}
                     json.dump(config, file, indent=4)
                 QMessageBox.information(main_window, "Success", "Configuration saved successfully.")
             except Exception as e:
@@ -97,12 +84,26 @@ def load_settings_from_file(main_window, file_name):
     Load settings from the selected JSON file and apply them.
     """
     from src.control.lighting_control import send_loaded_led_commands
+    from src.utils.lighting_utils import set_LED_commands
+    from src.utils.preset_utils import get_preset_library, take_legacy_presets
     try:
         with open(file_name, 'r') as file:
             config = json.load(file)
-            # Save the loaded configuration to dynamic_config.json
-            with open(DYNAMIC_CONFIG_PATH, 'w') as dynamic_config_file:
-                json.dump(config, dynamic_config_file, indent=4)
+            # Move the presets into the preset library, including those of files saved before it existed
+            presets = take_legacy_presets(config)
+            presets.update(config.pop("led_presets", {}))
+            get_preset_library().update(presets)
+            # Save the loaded configuration to dynamic_config.json. The live LED commands and journal generation
+            # are kept until set_LED_commands replaces both with a new generation, so a crash in between
+            # never pairs the imported commands with the old journal
+            saved_config = dict(config)
+            live_config = load_dynamic_config()
+            for key in ("led_commands", "led_journal_generation"):
+                saved_config.pop(key, None)
+                if key in live_config:
+                    saved_config[key] = live_config[key]
+            save_dynamic_config(saved_config)
+            set_LED_commands(config.get("led_commands", []))
             
             # Update runtime state
             update_runtime_state_from_config(config)
@@ -128,8 +129,7 @@ def check_storage(main_window):
     free_mb = free // (2**20)  # Convert bytes to MB
     print(f"Available storage: {free_mb} MB")
 
-    static_config = load_static_config()
-    critical_storage_value = static_config.get("critical_storage_value", 500)  # Default to 500 MB if not set
+    critical_storage_value = load_static_config().critical_storage_value
 
     if free_mb < critical_storage_value:
         general_ui_updater.display_image(main_window, image_path="/home/pi/Documents/clinostat/src/assets/images/storage_error.png")
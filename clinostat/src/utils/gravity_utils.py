@@ -0,0 +1,133 @@
+import math
+import numpy as np
+from src.utils.config_utils import load_static_config
+from src.utils.motion_utils import calculate_motor_speeds
+from src.utils.runtime_state import runtime_state
+
+# Residual gravity, as a fraction of 1 g, below which the time average counts as converged
+DEFAULT_GRAVITY_THRESHOLD = 0.01
+
+def build_speed_grid(min_rpm, max_rpm, steps, directions=((True, True), (True, False))):
+    """
+    Return every (frame_rpm, core_rpm, (frame_cw, core_cw)) combination of steps speeds
+    between min_rpm and max_rpm and the given direction pairs.
+    """
+    speeds = np.round(np.linspace(min_rpm, max_rpm, steps), 3)
+    return [
+        (float(frame_rpm), float(core_rpm), direction)
+        for direction in directions for frame_rpm in speeds for core_rpm in speeds
+    ]
+
+def quantized_rpms(rpms):
+    """
+    Return the speeds the motors actually run at for the requested RPMs, after the microstepping
+    selection and the 0.001 sps resolution of the 0x01 command.
+    """
+    steps_per_rotation = load_static_config().motor_settings.steps_per_rotation
+    plans = calculate_motor_speeds(list(rpms))
+    sps = np.array([int(plan_sps * 1000) / 1000 for plan_sps, _ in plans])
+    microstepping = np.array([plan_microstepping for _, plan_microstepping in plans])
+    return sps * 60 / (steps_per_rotation * microstepping)
+
+def _running_means(k, t):
+    """
+    Return the means of sin(k * s) and cos(k * s) for s over [0, t] for arrays of angular velocities k.
+    """
+    kt = k * t
+    divisor = np.where(k == 0, 1.0, k) * t
+    mean_sin = np.where(k == 0, 0.0, (1 - np.cos(kt)) / divisor)
+    mean_cos = np.where(k == 0, 1.0, np.sin(kt) / divisor)
+    return mean_sin, mean_cos
+
+def _inverse(k):
+    """
+    Return 1 / |k|, or 0 where k is 0.
+    """
+    k = np.abs(k)
+    return np.divide(1.0, k, out=np.zeros_like(k), where=k != 0)
+
+def simulate_gravity_average(pairs, duration=3600, threshold=DEFAULT_GRAVITY_THRESHOLD):
+    """
+    Compute the time-averaged gravity vector seen by the sample for (frame_rpm, core_rpm, (frame_cw, core_cw)) pairs.
+
+    The frame turns about the horizontal x axis and the core about the frame's y axis, so in the
+    sample's coordinates gravity is (sin(core) cos(frame), -sin(frame), -cos(core) cos(frame)),
+    a sum of sines and cosines of the frame angle and of the sum and difference of the two angles.
+    Their running averages have closed forms, so every pair is evaluated at once without stepping through time.
+    Speeds are quantized as the motors would run them.
+
+    The average of sin(k s) or cos(k s) over [0, t] is at most 2 / (|k| t), so the magnitude of the
+    averaged vector is bounded by an envelope C / t. The convergence time is the time C / threshold after
+    which the magnitude is guaranteed to stay below threshold. It is inf when the two motors turn at
+    the same quantized speed, where part of gravity never averages out.
+
+    Return a dictionary of arrays with one entry per pair: the requested and quantized speeds,
+    the directions, the averaged gravity vector after duration seconds, its magnitude and the convergence time.
+    """
+    frame_rpm = np.array([pair[0] for pair in pairs], dtype=float)
+    core_rpm = np.array([pair[1] for pair in pairs], dtype=float)
+    frame_cw = np.array([pair[2][0] for pair in pairs], dtype=bool)
+    core_cw = np.array([pair[2][1] for pair in pairs], dtype=bool)
+    actual_frame_rpm = quantized_rpms(frame_rpm)
+    actual_core_rpm = quantized_rpms(core_rpm)
+    a = np.where(frame_cw, 1, -1) * actual_frame_rpm * 2 * math.pi / 60
+    b = np.where(core_cw, 1, -1) * actual_core_rpm * 2 * math.pi / 60
+
+    sum_sin, sum_cos = _running_means(b + a, duration)
+    difference_sin, difference_cos = _running_means(b - a, duration)
+    frame_sin, _ = _running_means(a, duration)
+    residual = np.stack((
+        (sum_sin + difference_sin) / 2,
+        -frame_sin,
+        -(difference_cos + sum_cos) / 2,
+    ), axis=1)
+
+    # Envelopes of the x, y and z components multiplied by t
+    x_envelope = _inverse(b + a) + _inverse(b - a)
+    y_envelope = 2 * _inverse(a)
+    z_envelope = x_envelope / 2
+    convergence_time = np.sqrt(x_envelope ** 2 + y_envelope ** 2 + z_envelope ** 2) / threshold
+    convergence_time[(b + a == 0) | (b - a == 0)] = np.inf
+
+    return {
+        "frame_rpm": frame_rpm,
+        "core_rpm": core_rpm,
+        "frame_cw": frame_cw,
+        "core_cw": core_cw,
+        "actual_frame_rpm": actual_frame_rpm,
+        "actual_core_rpm": actual_core_rpm,
+        "residual": residual,
+        "residual_magnitude": np.linalg.norm(residual, axis=1),
+        "convergence_time": convergence_time,
+    }
+
+def recommend_speed_pairs(results, count=5):
+    """
+    Return up to count speed pairs from simulate_gravity_average results, fastest converging first,
+    as dictionaries with frame_rpm, core_rpm, frame_cw, core_cw, residual_magnitude and convergence_time.
+    Ties are broken by the smaller residual at the end of the simulation.
+    """
+    converged = np.flatnonzero(np.isfinite(results["convergence_time"]))
+    order = converged[np.lexsort((results["residual_magnitude"][converged], results["convergence_time"][converged]))]
+    return [
+        {
+            "frame_rpm": float(results["frame_rpm"][index]),
+            "core_rpm": float(results["core_rpm"][index]),
+            "frame_cw": bool(results["frame_cw"][index]),
+            "core_cw": bool(results["core_cw"][index]),
+            "residual_magnitude": float(results["residual_magnitude"][index]),
+            "convergence_time": float(results["convergence_time"][index]),
+        }
+        for index in order[:count]
+    ]
+
+def load_speed_pair(recommendation):
+    """
+    Load a recommended speed pair into the runtime state, unlinking the motors.
+    The caller sends it to the motors with motor_control.set_motor_speed.
+    """
+    runtime_state.set_linked(False)
+    runtime_state.set_motor_speed(1, recommendation["frame_rpm"])
+    runtime_state.set_motor_speed(2, recommendation["core_rpm"])
+    runtime_state.set_motor_direction(1, recommendation["frame_cw"])
+    runtime_state.set_motor_direction(2, recommendation["core_cw"])
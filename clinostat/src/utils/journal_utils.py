@@ -0,0 +1,105 @@
+import os
+import struct
+import threading
+from src.utils.framing_utils import calculate_crc16
+
+# File header: 4-byte magic and the 32-bit generation of the data the journal extends
+JOURNAL_HEADER = struct.Struct(">4sI")
+# Each record is a 16-bit length, the payload and a CRC16 of the payload
+RECORD_LENGTH = struct.Struct(">H")
+RECORD_CRC = struct.Struct(">H")
+
+class Journal:
+    """
+    Append-only file of length-prefixed, CRC-checked records.
+    The generation in the header ties the journal to the snapshot it extends: when the records are
+    compacted into a new snapshot, the journal is reset with the snapshot's new generation, and a
+    journal whose generation does not match is stale and discarded.
+    A record that was only partly written when the system went down fails its CRC and is dropped
+    along with anything after it, leaving the earlier records intact.
+    """
+    def __init__(self, path, magic):
+        self.path = path
+        self.magic = magic
+        self.lock = threading.Lock()
+        self.file = None
+        self.records = []
+        self.generation = None
+
+    def open(self, generation):
+        """
+        Load the records for the given generation, starting an empty journal if the file is missing or stale.
+        """
+        with self.lock:
+            records, valid_size = self.read_records(generation)
+            if records is None:
+                self.reset_file(generation)
+                return
+            self.records = records
+            self.generation = generation
+            self.file = open(self.path, "r+b")
+            self.file.truncate(valid_size)  # Drop a torn record at the end
+            self.file.seek(valid_size)
+
+    def read_records(self, generation):
+        """
+        Return (records, valid_size) for the file, or (None, 0) if it is missing or belongs to another generation.
+        """
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None, 0
+        if len(data) < JOURNAL_HEADER.size or JOURNAL_HEADER.unpack_from(data) != (self.magic, generation):
+            return None, 0
+        records = []
+        offset = JOURNAL_HEADER.size
+        while offset + RECORD_LENGTH.size <= len(data):
+            (length,) = RECORD_LENGTH.unpack_from(data, offset)
+            end = offset + RECORD_LENGTH.size + length
+            if end + RECORD_CRC.size > len(data):
+                break
+            payload = data[offset + RECORD_LENGTH.size:end]
+            if RECORD_CRC.unpack_from(data, end)[0] != calculate_crc16(payload):
+                break
+            records.append(payload)
+            offset = end + RECORD_CRC.size
+        return records, offset
+
+    def append(self, payload):
+        """
+        Append a record and sync it to disk.
+        """
+        payload = bytes(payload)
+        with self.lock:
+            self.file.write(RECORD_LENGTH.pack(len(payload)) + payload + RECORD_CRC.pack(calculate_crc16(payload)))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.records.append(payload)
+
+    def reset(self, generation):
+        """
+        Replace the journal with an empty one for a new generation.
+        """
+        with self.lock:
+            self.reset_file(generation)
+
+    def reset_file(self, generation):
+        if self.file is not None:
+            self.file.close()
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(JOURNAL_HEADER.pack(self.magic, generation))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+        self.file = open(self.path, "r+b")
+        self.file.seek(0, os.SEEK_END)
+        self.records = []
+        self.generation = generation
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
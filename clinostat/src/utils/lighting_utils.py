@@ -1,32 +1,312 @@
-from src.utils.general_utils import load_dynamic_config, save_dynamic_config
+import time
+import bisect
+import struct
+import threading
+from src.utils.general_utils import load_dynamic_config, save_dynamic_config, flush_dynamic_config
+from src.utils.framing_utils import PACKET_MAX_SIZE, PACKET_OVERHEAD, NUM_LEDS
+from src.utils.config_utils import load_static_config
+from src.utils.journal_utils import Journal
+
+# Batched LED command (0x06) layout: one flags byte followed by 7-byte segments
+LED_SEGMENT_SIZE = 7
+LED_BATCH_FLAG_DISPLAY = 0x01
+LED_BATCH_MAX_SEGMENTS = (PACKET_MAX_SIZE - PACKET_OVERHEAD - 1) // LED_SEGMENT_SIZE
+
+# LED commands confirmed since the last compaction are appended to this journal instead of rewriting the config
+LED_JOURNAL_PATH = "/home/pi/Documents/clinostat/config/led_commands.journal"
+LED_JOURNAL_MAGIC = b"LEDJ"
+LED_COMMAND_RECORD = struct.Struct("7B")  # start_led, end_led, red, green, blue, white, brightness
+
+_led_journal = None
+_led_journal_lock = threading.Lock()
+
+def get_LED_journal():
+    """
+    Return the LED command journal, opening it for the generation stored in the dynamic configuration.
+    """
+    global _led_journal
+    with _led_journal_lock:
+        if _led_journal is None:
+            journal = Journal(LED_JOURNAL_PATH, LED_JOURNAL_MAGIC)
+            journal.open(load_dynamic_config().get("led_journal_generation", 0))
+            _led_journal = journal
+        return _led_journal
+
+def get_LED_commands():
+    """
+    Return the current series of LED commands: the compacted list in the dynamic configuration followed by the journal.
+    """
+    journal = get_LED_journal()
+    commands = load_dynamic_config().get("led_commands", [])
+    commands.extend(led_segment_to_command(LED_COMMAND_RECORD.unpack(record)) for record in journal.records)
+    return commands
 
 def save_LED_command(command):
     """
-    Save the LED command to the dynamic configuration file.
+    Append the LED command to the journal, compacting it into the dynamic configuration when it gets long.
+    """
+    journal = get_LED_journal()
+    journal.append(LED_COMMAND_RECORD.pack(*led_command_to_segment(command)))
+    if len(journal.records) >= load_static_config().led_journal_compact_threshold:
+        compact_LED_journal()
+
+def set_LED_commands(commands):
     """
+    Replace the series of LED commands in the dynamic configuration and start a new journal.
+    The configuration is written with a new journal generation before the journal is reset, so
+    after a crash in between the old journal is recognised as stale. The new generation is above both
+    the configured and the live one, as an imported configuration may carry an older generation or none.
+    """
+    journal = get_LED_journal()
     config = load_dynamic_config()
-    if "led_commands" not in config:
-        config["led_commands"] = []
-    config["led_commands"].append(command)
+    if (not journal.records and config.get("led_commands") == list(commands)
+            and config.get("led_journal_generation", 0) == journal.generation):
+        return
+    generation = max(config.get("led_journal_generation", 0), journal.generation) + 1
+    config["led_commands"] = list(commands)
+    config["led_journal_generation"] = generation
     save_dynamic_config(config)
+    flush_dynamic_config()
+    journal.reset(generation)
+
+def compact_LED_journal():
+    """
+    Move the journaled LED commands into the dynamic configuration, compacting the whole series.
+    """
+    set_LED_commands(compact_LED_commands(get_LED_commands()))
 
 def clear_LED_commands():
     """
     Clear all LED commands from the dynamic configuration file.
     """
-    config = load_dynamic_config()
-    config["led_commands"] = []
-    save_dynamic_config(config)
+    set_LED_commands([])
 
-def save_LED_preset(preset_name):
+def led_command_to_segment(command):
     """
-    Save the current series of lighting commands as a preset.
+    Convert a stored LED command dictionary to its 7-byte segment payload.
     """
-    config = load_dynamic_config()
-    if "led_commands" in config:
-        config[preset_name] = config["led_commands"]
-        save_dynamic_config(config)
-        print(f"Saved preset: {preset_name}")
+    return [
+        command["start_led"],
+        command["end_led"],
+        command["red"],
+        command["green"],
+        command["blue"],
+        command["white"],
+        command["brightness"]
+    ]
+
+def led_segment_to_command(segment):
+    """
+    Convert a 7-byte segment back to an LED command dictionary.
+    """
+    start_led, end_led, red, green, blue, white, brightness = segment
+    return {
+        "start_led": start_led,
+        "end_led": end_led,
+        "red": red,
+        "green": green,
+        "blue": blue,
+        "white": white,
+        "brightness": brightness
+    }
+
+def compact_led_segments(segments):
+    """
+    Resolve a series of segments, applied in order, into the fewest non-overlapping runs that leave the strip
+    in the same final state. Later segments overwrite the LEDs they cover and neighbouring runs with the same
+    colour are joined. The firmware applies the brightness to the whole strip, so every run is given the
+    brightness of the last segment.
+    """
+    # Sorted, non-overlapping runs as parallel lists of start LEDs and [start, end, colour] entries
+    starts = []
+    runs = []
+    brightness = None
+    for segment in segments:
+        start, end = segment[0], segment[1]
+        colour = tuple(segment[2:6])
+        brightness = segment[6]
+        if start > end:
+            continue  # Only changes the brightness
+
+        # Runs from the last one starting before this segment to the last one starting inside it may overlap
+        first = max(bisect.bisect_left(starts, start) - 1, 0)
+        last = bisect.bisect_right(starts, end)
+        replacement = []
+        for run_start, run_end, run_colour in runs[first:last]:
+            if run_end < start or run_start > end:
+                replacement.append([run_start, run_end, run_colour])
+                continue
+            if run_start < start:
+                replacement.append([run_start, start - 1, run_colour])  # Uncovered part on the left
+            if run_end > end:
+                replacement.append([end + 1, run_end, run_colour])  # Uncovered part on the right
+        replacement.append([start, end, colour])
+        replacement.sort()
+        runs[first:last] = replacement
+        starts[first:last] = [run[0] for run in replacement]
+
+    compacted = []
+    for run_start, run_end, run_colour in runs:
+        if compacted and compacted[-1][1] + 1 == run_start and tuple(compacted[-1][2:6]) == run_colour:
+            compacted[-1][1] = run_end
+        else:
+            compacted.append([run_start, run_end, *run_colour, brightness])
+    return compacted
+
+def compact_LED_commands(commands):
+    """
+    Compact a series of LED command dictionaries with compact_led_segments.
+    """
+    return [led_segment_to_command(segment) for segment in compact_led_segments([led_command_to_segment(command) for command in commands])]
+
+def pack_led_segments(segments, display=True):
+    """
+    Pack LED segments into the fewest batched 0x06 payloads.
+    The display flag is set on the last payload so the strip is shown without a separate 0x04 packet.
+    """
+    segments = compact_led_segments(segments)
+    payloads = []
+    for i in range(0, len(segments), LED_BATCH_MAX_SEGMENTS):
+        payload = [0]
+        for segment in segments[i:i + LED_BATCH_MAX_SEGMENTS]:
+            payload.extend(segment)
+        payloads.append(payload)
+    if display and payloads:
+        payloads[-1][0] |= LED_BATCH_FLAG_DISPLAY
+    return payloads
+
+class LedFramebuffer:
+    """
+    Host-side mirror of the strip: the RGBW colour of every LED and the strip brightness, with None where unknown.
+    Segments are applied as they are sent, and diff returns the segments needed to reach a target frame.
+    """
+    def __init__(self, num_leds=NUM_LEDS):
+        self.num_leds = num_leds
+        self.lock = threading.Lock()
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Forget the strip state, for example after a reset or a failed write.
+        """
+        with self.lock:
+            self.pixels = [None] * self.num_leds
+            self.brightness = None
+
+    def snapshot(self):
+        """
+        Return the strip state as a hashable (pixels, brightness) pair.
+        """
+        with self.lock:
+            return tuple(self.pixels), self.brightness
+
+    def copy(self):
+        framebuffer = LedFramebuffer(self.num_leds)
+        with self.lock:
+            framebuffer.pixels = list(self.pixels)
+            framebuffer.brightness = self.brightness
+        return framebuffer
+
+    def render(self, segments):
+        """
+        Return the (pixels, brightness) the strip would show after applying segments to the current state.
+        """
+        with self.lock:
+            pixels = list(self.pixels)
+            brightness = self.brightness
+        for segment in segments:
+            start = max(segment[0], 1) - 1
+            end = min(segment[1], self.num_leds)
+            pixels[start:end] = [tuple(segment[2:6])] * max(end - start, 0)
+            brightness = segment[6]
+        return pixels, brightness
+
+    def apply(self, segments):
+        pixels, brightness = self.render(segments)
+        with self.lock:
+            self.pixels = pixels
+            self.brightness = brightness
+
+    def diff(self, segments):
+        """
+        Return the fewest non-overlapping segments that take the strip from its current state to the state after segments.
+        Within each run of LEDs sharing a target colour, one segment spans from the first to the last LED that changes.
+        Unknown LEDs count as changed.
+        """
+        target, brightness = self.render(segments)
+        with self.lock:
+            current = list(self.pixels)
+            brightness_changed = brightness != self.brightness
+
+        changes = []
+        index = 0
+        while index < self.num_leds:
+            colour = target[index]
+            run_end = index
+            while run_end + 1 < self.num_leds and target[run_end + 1] == colour:
+                run_end += 1
+            if colour is not None:
+                changed = [i for i in range(index, run_end + 1) if current[i] != colour]
+                if changed:
+                    changes.append([changed[0] + 1, changed[-1] + 1, *colour, brightness])
+            index = run_end + 1
+
+        if brightness_changed and not changes and brightness is not None:
+            # The brightness applies to the whole strip, so rewriting any known LED sets it
+            for index, colour in enumerate(target):
+                if colour is not None:
+                    changes.append([index + 1, index + 1, *colour, brightness])
+                    break
+        return changes
+
+_led_framebuffer = LedFramebuffer()
+
+def get_led_framebuffer():
+    return _led_framebuffer
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+def parse_time_of_day(value):
+    """
+    Return the seconds since midnight for an "HH:MM" or "HH:MM:SS" string or a number of seconds.
+    """
+    if isinstance(value, str):
+        parts = [int(part) for part in value.split(":")]
+        if not 2 <= len(parts) <= 3:
+            raise ValueError(f"Invalid time of day: {value}")
+        value = parts[0] * 3600 + parts[1] * 60 + (parts[2] if len(parts) == 3 else 0)
+    if not 0 <= value < SECONDS_PER_DAY:
+        raise ValueError(f"Time of day out of range: {value}")
+    return value
+
+def daily_schedule(transitions, now=None):
+    """
+    Convert a list of (time of day, target) transitions into lighting schedule steps that repeat every day.
+    Return (steps, offset), where steps is a list of (target, duration) starting at the earliest
+    transition and offset is how far into the day's steps the local time now is.
+    """
+    if not transitions:
+        raise ValueError("A daily schedule needs at least one transition")
+    times = sorted((parse_time_of_day(time_of_day), target) for time_of_day, target in transitions)
+    steps = []
+    for index, (start, target) in enumerate(times):
+        end = times[index + 1][0] if index + 1 < len(times) else times[0][0] + SECONDS_PER_DAY
+        if end > start:
+            steps.append((target, end - start))
+    now = time.localtime() if now is None else now
+    seconds = now.tm_hour * 3600 + now.tm_min * 60 + now.tm_sec
+    return steps, (seconds - times[0][0]) % SECONDS_PER_DAY
+
+def brightness_ramp(preset_name, start_brightness, end_brightness, duration, steps=10):
+    """
+    Return lighting schedule steps that show a preset while stepping its brightness linearly
+    from start_brightness to end_brightness over duration seconds, for dawn and dusk transitions.
+    """
+    steps = max(1, int(steps))
+    return [
+        ((preset_name, round(start_brightness + (end_brightness - start_brightness) * step / max(steps - 1, 1))), duration / steps)
+        for step in range(steps)
+    ]
 
 def update_preset_durations(main_window, preset_1_duration, preset_2_duration):
     """
@@ -0,0 +1,221 @@
+import os
+import json
+import zlib
+import bisect
+import struct
+import threading
+import numpy as np
+from src.utils.buffer_utils import parse_channels, write_columns_csv
+
+# File header: magic, version, record size, length of the channel description, then the description as JSON
+LOG_HEADER = struct.Struct(">4sHHH")
+LOG_MAGIC = b"SLOG"
+LOG_VERSION = 1
+# Segment header: magic, record count, first and last timestamp and a CRC32 of the records
+SEGMENT_HEADER = struct.Struct(">4sIddI")
+SEGMENT_MAGIC = b"SEGM"
+# Index entry: segment offset, record count, first and last timestamp
+INDEX_ENTRY = struct.Struct(">QIdd")
+
+def record_dtype(channels):
+    """
+    Return the NumPy dtype of a fixed-size record holding one sample of the channels.
+    """
+    return np.dtype([(name, dtype) if width == 1 else (name, dtype, (width,)) for name, dtype, width in parse_channels(channels)])
+
+class SensorLog:
+    """
+    Append-only binary log of fixed-size sensor records, written in segments.
+
+    Each segment is a header with the record count, the time range and a CRC32 of the records,
+    followed by the records. An index file holds the offset and time range of every segment, so
+    a time range is found with a binary search and read with one seek per segment.
+    Segments are appended in time order. The index is rebuilt from the segment headers if it is
+    missing or behind the log, and a segment that was only partly written is cut off when the log is opened.
+    """
+    def __init__(self, path, channels):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.channels = [tuple(channel) for channel in channels]
+        self.dtype = record_dtype(channels)
+        self.lock = threading.Lock()
+        self.segments = []  # (offset, record count, start time, end time)
+        self.file = None
+        self.data_offset = None
+
+    def open(self):
+        """
+        Open the log, creating it if it does not exist, and load its index.
+        """
+        with self.lock:
+            if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+                description = json.dumps(self.channels).encode("ascii")
+                with open(self.path, "wb") as file:
+                    file.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, self.dtype.itemsize, len(description)) + description)
+                    file.flush()
+                    os.fsync(file.fileno())
+                open(self.index_path, "wb").close()
+            self.file = open(self.path, "r+b")
+            self.data_offset = self.read_header()
+            self.load_index()
+            self.file.seek(0, os.SEEK_END)
+
+    @classmethod
+    def open_existing(cls, path):
+        """
+        Open a log written earlier, taking the channels from its header.
+        """
+        with open(path, "rb") as file:
+            magic, version, _, description_length = LOG_HEADER.unpack(file.read(LOG_HEADER.size))
+            if magic != LOG_MAGIC or version != LOG_VERSION:
+                raise ValueError(f"Not a sensor log: {path}")
+            channels = json.loads(file.read(description_length))
+        log = cls(path, channels)
+        log.open()
+        return log
+
+    def read_header(self):
+        self.file.seek(0)
+        magic, version, record_size, description_length = LOG_HEADER.unpack(self.file.read(LOG_HEADER.size))
+        if magic != LOG_MAGIC or version != LOG_VERSION:
+            raise ValueError(f"Not a sensor log: {self.path}")
+        if record_size != self.dtype.itemsize:
+            raise ValueError(f"Sensor log {self.path} has {record_size}-byte records, expected {self.dtype.itemsize}")
+        return LOG_HEADER.size + description_length
+
+    def load_index(self):
+        """
+        Load the index, then index any complete segments after the last indexed one and cut off a torn segment.
+        """
+        segments = []
+        rebuilt = True
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as file:
+                data = file.read()
+            usable = len(data) - len(data) % INDEX_ENTRY.size
+            segments = [INDEX_ENTRY.unpack_from(data, offset) for offset in range(0, usable, INDEX_ENTRY.size)]
+            rebuilt = usable != len(data)  # A torn entry at the end
+
+        file_size = os.fstat(self.file.fileno()).st_size
+        offset = self.data_offset
+        if segments:
+            offset, count, _, _ = segments[-1]
+            offset += SEGMENT_HEADER.size + count * self.dtype.itemsize
+            if offset > file_size:  # The index is ahead of the log
+                segments = []
+                offset = self.data_offset
+                rebuilt = True
+
+        while offset + SEGMENT_HEADER.size <= file_size:
+            self.file.seek(offset)
+            magic, count, start_time, end_time, _ = SEGMENT_HEADER.unpack(self.file.read(SEGMENT_HEADER.size))
+            end = offset + SEGMENT_HEADER.size + count * self.dtype.itemsize
+            if magic != SEGMENT_MAGIC or end > file_size:
+                break
+            segments.append((offset, count, start_time, end_time))
+            offset = end
+            rebuilt = True
+        if offset < file_size:
+            print(f"Discarding {file_size - offset} bytes of an incomplete segment in {self.path}")
+            self.file.truncate(offset)
+
+        self.segments = segments
+        if rebuilt:
+            with open(self.index_path, "wb") as file:
+                file.write(b"".join(INDEX_ENTRY.pack(*segment) for segment in segments))
+
+    def append(self, columns):
+        """
+        Append one segment holding the samples in columns, a dictionary of channel arrays with
+        multi-axis channels stored axis first, as produced by ArchiveBuffer.columns.
+        """
+        count = columns[self.dtype.names[0]].shape[-1]
+        if not count:
+            return
+        records = np.empty(count, dtype=self.dtype)
+        for name in self.dtype.names:
+            column = columns[name]
+            records[name] = column.T if column.ndim > 1 else column
+        timestamps = records[self.dtype.names[0]]
+        payload = records.tobytes()
+        header = SEGMENT_HEADER.pack(SEGMENT_MAGIC, len(records), timestamps[0], timestamps[-1], zlib.crc32(payload))
+        with self.lock:
+            offset = self.file.seek(0, os.SEEK_END)
+            self.file.write(header + payload)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            segment = (offset, len(records), float(timestamps[0]), float(timestamps[-1]))
+            with open(self.index_path, "ab") as file:
+                file.write(INDEX_ENTRY.pack(*segment))
+            self.segments.append(segment)
+
+    def read_segment(self, segment):
+        """
+        Return the records of an index entry, or None if its CRC does not match.
+        """
+        offset, count, _, _ = segment
+        with self.lock:
+            self.file.seek(offset)
+            data = self.file.read(SEGMENT_HEADER.size + count * self.dtype.itemsize)
+            self.file.seek(0, os.SEEK_END)
+        crc = SEGMENT_HEADER.unpack_from(data)[4]
+        payload = data[SEGMENT_HEADER.size:]
+        if zlib.crc32(payload) != crc:
+            print(f"CRC mismatch in the segment at {offset} of {self.path}")
+            return None
+        return np.frombuffer(payload, dtype=self.dtype)
+
+    def iter_segments(self, start_time=None, end_time=None):
+        """
+        Yield the records of every segment that overlaps the time range, which is open where a bound is None.
+        """
+        with self.lock:
+            segments = list(self.segments)
+        first = 0
+        if start_time is not None:
+            # Segments are in time order, so the first one that ends at or after start_time is found by bisection
+            first = bisect.bisect_left([segment[3] for segment in segments], start_time)
+        for segment in segments[first:]:
+            if end_time is not None and segment[2] > end_time:
+                break
+            records = self.read_segment(segment)
+            if records is not None:
+                yield records
+
+    def iter_records(self, start_time=None, end_time=None):
+        """
+        Yield the records with timestamps in the time range, one array per segment.
+        """
+        for records in self.iter_segments(start_time, end_time):
+            timestamps = records[self.dtype.names[0]]
+            if start_time is not None and timestamps[0] < start_time or end_time is not None and timestamps[-1] > end_time:
+                mask = np.ones(len(records), dtype=bool)
+                if start_time is not None:
+                    mask &= timestamps >= start_time
+                if end_time is not None:
+                    mask &= timestamps <= end_time
+                records = records[mask]
+            yield records
+
+    def read(self, start_time=None, end_time=None):
+        """
+        Return the records with timestamps in the time range as one structured array.
+        """
+        parts = list(self.iter_records(start_time, end_time))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=self.dtype)
+
+    def write_csv(self, file, start_time=None, end_time=None):
+        """
+        Write the records in the time range to an open text file as CSV rows, one column per axis.
+        """
+        channels = parse_channels(self.channels)
+        for records in self.iter_records(start_time, end_time):
+            write_columns_csv(file, channels, {
+                name: records[name].T if width > 1 else records[name] for name, _, width in channels
+            }, len(records))
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
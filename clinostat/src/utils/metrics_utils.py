@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import bisect
+import threading
+
+# Upper bounds of the latency histogram buckets in milliseconds; the last bucket is open ended
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram with count, sum and maximum.
+    """
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, seconds):
+        milliseconds = seconds * 1000
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        self.maximum = max(self.maximum, milliseconds)
+
+    def percentile(self, fraction):
+        """
+        Return the upper bucket bound in milliseconds below which the given fraction of samples fall.
+        """
+        if not self.count:
+            return None
+        threshold = fraction * self.count
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS + (None,), self.counts):
+            cumulative += count
+            if cumulative >= threshold:
+                return bound if bound is not None else round(self.maximum, 3)
+        return round(self.maximum, 3)
+
+    def snapshot(self):
+        buckets = {f"<={bound}": count for bound, count in zip(LATENCY_BUCKETS_MS, self.counts)}
+        buckets["inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else None,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": round(self.maximum, 3),
+            "buckets_ms": buckets,
+        }
+
+class TransportMetrics:
+    """
+    Counters and latency histograms for the I2C and UART links of the Communication class.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.start_time = time.monotonic()
+            self.send_latency = {}  # command -> queued to written LatencyHistogram
+            self.bus_time = {}      # command -> time spent in the transport write
+            self.i2c_packets = 0
+            self.i2c_bytes = 0
+            self.i2c_errors = 0
+            self.i2c_retries = 0
+            self.i2c_bus_seconds = 0.0
+            self.i2c_paced_seconds = 0.0
+            self.coalesced_commands = 0
+            self.queue_depth = 0
+            self.max_queue_depth = 0
+            self.uart_bytes_received = 0
+            self.uart_bytes_sent = 0
+            self.uart_messages = 0
+            self.uart_crc_mismatches = 0
+            self.uart_malformed_lines = 0
+            self.last_snapshot_time = self.start_time
+            self.last_snapshot_i2c_bytes = 0
+            self.last_snapshot_uart_bytes = 0
+
+    def record_queue_depth(self, depth):
+        with self.lock:
+            self.queue_depth = depth
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def record_i2c_send(self, command, queued_at, started_at, finished_at, byte_count, success, paced_seconds=0.0):
+        with self.lock:
+            key = f"0x{command:02X}"
+            self.send_latency.setdefault(key, LatencyHistogram()).record(finished_at - queued_at)
+            self.bus_time.setdefault(key, LatencyHistogram()).record(finished_at - started_at)
+            self.i2c_packets += 1
+            self.i2c_bytes += byte_count
+            self.i2c_bus_seconds += finished_at - started_at
+            self.i2c_paced_seconds += paced_seconds
+            if not success:
+                self.i2c_errors += 1
+
+    def record_i2c_retry(self):
+        with self.lock:
+            self.i2c_retries += 1
+
+    def record_coalesced(self):
+        with self.lock:
+            self.coalesced_commands += 1
+
+    def record_uart_received(self, byte_count):
+        with self.lock:
+            self.uart_bytes_received += byte_count
+
+    def record_uart_sent(self, byte_count):
+        with self.lock:
+            self.uart_bytes_sent += byte_count
+
+    def record_uart_message(self):
+        with self.lock:
+            self.uart_messages += 1
+
+    def record_uart_crc_mismatch(self, count=1):
+        with self.lock:
+            self.uart_crc_mismatches += count
+
+    def record_uart_malformed(self):
+        with self.lock:
+            self.uart_malformed_lines += 1
+
+    def snapshot(self, reset_window=False):
+        """
+        Return the current metrics as a JSON-serialisable dictionary.
+        Rates are given both over the whole run and over the recent window, which runs from the last
+        snapshot taken with reset_window set. Only the periodic snapshot writer resets the window.
+        """
+        with self.lock:
+            now = time.monotonic()
+            elapsed = max(now - self.start_time, 1e-9)
+            interval = max(now - self.last_snapshot_time, 1e-9)
+            uart_bytes = self.uart_bytes_received + self.uart_bytes_sent
+            snapshot = {
+                "uptime_s": round(elapsed, 3),
+                "i2c": {
+                    "packets": self.i2c_packets,
+                    "bytes": self.i2c_bytes,
+                    "errors": self.i2c_errors,
+                    "retries": self.i2c_retries,
+                    "coalesced_commands": self.coalesced_commands,
+                    "queue_depth": self.queue_depth,
+                    "max_queue_depth": self.max_queue_depth,
+                    "bytes_per_second": round(self.i2c_bytes / elapsed, 3),
+                    "recent_bytes_per_second": round((self.i2c_bytes - self.last_snapshot_i2c_bytes) / interval, 3),
+                    # Fraction of time spent in bus transactions, and including the pacing delays after them
+                    "bus_busy_fraction": round(self.i2c_bus_seconds / elapsed, 6),
+                    "link_busy_fraction": round((self.i2c_bus_seconds + self.i2c_paced_seconds) / elapsed, 6),
+                    "send_latency": {key: histogram.snapshot() for key, histogram in self.send_latency.items()},
+                    "bus_time": {key: histogram.snapshot() for key, histogram in self.bus_time.items()},
+                },
+                "uart": {
+                    "bytes_received": self.uart_bytes_received,
+                    "bytes_sent": self.uart_bytes_sent,
+                    "messages": self.uart_messages,
+                    "crc_mismatches": self.uart_crc_mismatches,
+                    "malformed_lines": self.uart_malformed_lines,
+                    "bytes_per_second": round(uart_bytes / elapsed, 3),
+                    "recent_bytes_per_second": round((uart_bytes - self.last_snapshot_uart_bytes) / interval, 3),
+                },
+            }
+            if reset_window:
+                self.last_snapshot_time = now
+                self.last_snapshot_i2c_bytes = self.i2c_bytes
+                self.last_snapshot_uart_bytes = uart_bytes
+        return snapshot
+
+    def write_snapshot(self, path):
+        """
+        Write a snapshot to a JSON file, replacing the previous one atomically.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self.snapshot(reset_window=True), file, indent=4)
+        os.replace(temp_path, path)
+
+    def start_snapshot_writer(self, path, interval):
+        """
+        Write a snapshot file every interval seconds from a daemon thread.
+        """
+        def write_periodically():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write_snapshot(path)
+                except OSError as e:
+                    print(f"Error writing metrics snapshot: {e}")
+
+        thread = threading.Thread(target=write_periodically, daemon=True)
+        thread.start()
+        return thread
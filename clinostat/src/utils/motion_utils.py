@@ -1,24 +1,180 @@
-import json
-import os
+import bisect
+import random
+from src.utils.config_utils import load_static_config
+from src.utils.framing_utils import encode_motor_state
 
-# Load motor settings from the static configuration file
-script_dir = os.path.dirname(os.path.abspath(__file__))
-config_path = os.path.join(script_dir, "../../config/static_config.json")
+# Step rate window in which the drivers run smoothly
+MIN_SPS = 400
+MAX_SPS = 1000
 
-with open(config_path, "r") as file:
-    config = json.load(file)
+class SpeedPlanner:
+    """
+    Precomputed table of the microstepping to use for every reachable RPM.
+    The lowest microstepping whose step rate falls within the sps window is used, as it gives the lowest sps.
+    """
+    def __init__(self, motor_steps, gear_ratio, microstepping_options, min_sps=MIN_SPS, max_sps=MAX_SPS):
+        self.min_sps = min_sps
+        self.max_sps = max_sps
+        # Higher microstepping reaches lower speeds, so sorting it in descending order sorts the table by RPM.
+        # Each entry is (min_rpm, max_rpm, microstepping, steps_per_rotation).
+        table = []
+        for microstepping in sorted(set(microstepping_options), reverse=True):
+            steps_per_rotation = motor_steps * gear_ratio * microstepping
+            table.append((min_sps * 60 / steps_per_rotation, max_sps * 60 / steps_per_rotation, microstepping, steps_per_rotation))
+        if not table:
+            raise ValueError("No microstepping options in the motor settings")
+        self.table = tuple(table)
+        self.min_rpms = [entry[0] for entry in table]
+        self.min_rpm = table[0][0]
+        self.max_rpm = table[-1][1]
+        # Speeds between the top of one entry and the bottom of the next cannot be reached
+        self.unreachable_ranges = [
+            (lower[1], upper[0]) for lower, upper in zip(table, table[1:]) if lower[1] < upper[0]
+        ]
 
-motor_settings = config["motor_settings"]
-motor_steps = motor_settings["motor_steps"]
-gear_ratio = motor_settings["gear_ratio"]
-microstepping_options = motor_settings["microstepping_options"]
+    def plan(self, rpm):
+        """
+        Return (sps, microstepping) for the RPM, or None if it cannot be reached within the sps window.
+        """
+        index = bisect.bisect_right(self.min_rpms, rpm) - 1
+        if index < 0:
+            return None
+        # Entries with a higher minimum RPM use a lower microstepping, so this is the best candidate
+        _, _, microstepping, steps_per_rotation = self.table[index]
+        sps = round((rpm * steps_per_rotation) / 60, 3)
+        if sps > self.max_sps:
+            return None
+        return sps, microstepping
+
+    def plan_many(self, rpms):
+        """
+        Return a list of (sps, microstepping) for a sequence of RPM setpoints, with None for unreachable speeds.
+        """
+        return [self.plan(rpm) for rpm in rpms]
+
+    def nearest_reachable_rpm(self, rpm):
+        if rpm < self.min_rpm:
+            return self.min_rpm
+        if rpm > self.max_rpm:
+            return self.max_rpm
+        for lower, upper in self.unreachable_ranges:
+            if lower < rpm < upper:
+                return lower if rpm - lower <= upper - rpm else upper
+        return rpm
+
+    def describe_range(self):
+        description = f"{self.min_rpm:.3f}-{self.max_rpm:.3f} RPM"
+        if self.unreachable_ranges:
+            gaps = ", ".join(f"{lower:.3f}-{upper:.3f}" for lower, upper in self.unreachable_ranges)
+            description += f" (except {gaps} RPM)"
+        return description
+
+_speed_planner = None
+
+def get_speed_planner():
+    """
+    Return the SpeedPlanner for the motor settings in the static configuration.
+    """
+    global _speed_planner
+    if _speed_planner is None:
+        motor_settings = load_static_config().motor_settings
+        _speed_planner = SpeedPlanner(
+            motor_settings.motor_steps, motor_settings.gear_ratio, motor_settings.microstepping_options
+        )
+    return _speed_planner
 
 def calculate_motor_speed(rpm):
-    best_sps, best_microstepping = None, None
-    for microstepping in microstepping_options:
-        steps_per_rotation = motor_steps * gear_ratio * microstepping
-        sps = round((rpm * steps_per_rotation) / 60, 3)
-        if 400 <= sps <= 1000 and (best_sps is None or sps < best_sps):
-            best_sps, best_microstepping = sps, microstepping
-    print(f"Best SPS: {best_sps}, Best Microstepping: {best_microstepping}")
-    return best_sps, best_microstepping
\ No newline at end of file
+    """
+    Return (sps, microstepping) for the RPM.
+    Unreachable speeds are reported and replaced with the nearest reachable speed.
+    """
+    planner = get_speed_planner()
+    plan = planner.plan(rpm)
+    if plan is None:
+        reachable_rpm = planner.nearest_reachable_rpm(rpm)
+        print(f"Speed of {rpm} RPM cannot be reached, using {reachable_rpm:.3f} RPM. Reachable speeds: {planner.describe_range()}")
+        plan = planner.plan(reachable_rpm)
+    return plan
+
+def calculate_motor_speeds(rpms):
+    """
+    Return a list of (sps, microstepping) for a sequence of RPM setpoints.
+    Unreachable speeds are replaced with the nearest reachable speed and reported once for the whole batch.
+    """
+    planner = get_speed_planner()
+    plans = planner.plan_many(rpms)
+    unreachable = [index for index, plan in enumerate(plans) if plan is None]
+    for index in unreachable:
+        plans[index] = planner.plan(planner.nearest_reachable_rpm(rpms[index]))
+    if unreachable:
+        print(f"{len(unreachable)} of {len(plans)} speeds cannot be reached and were clamped. Reachable speeds: {planner.describe_range()}")
+    return plans
+
+def ramp_profile(start_frame_rpm, end_frame_rpm, start_core_rpm, end_core_rpm, duration, step_interval=1.0, direction_cw=True):
+    """
+    Return a timeline of (time, frame_rpm, core_rpm, direction_cw) setpoints ramping linearly over duration seconds.
+    """
+    steps = max(1, int(round(duration / step_interval)))
+    timeline = []
+    for step in range(steps + 1):
+        fraction = step / steps
+        timeline.append((
+            round(fraction * duration, 6),
+            start_frame_rpm + (end_frame_rpm - start_frame_rpm) * fraction,
+            start_core_rpm + (end_core_rpm - start_core_rpm) * fraction,
+            direction_cw,
+        ))
+    return timeline
+
+def random_positioning_profile(duration, min_rpm, max_rpm, min_interval=10.0, max_interval=60.0, seed=None):
+    """
+    Return a random positioning machine timeline: at random intervals both motors change
+    to a random speed and direction. The same seed always gives the same timeline.
+    """
+    generator = random.Random(seed)
+    timeline = []
+    time = 0.0
+    while time < duration:
+        timeline.append((
+            round(time, 6),
+            round(generator.uniform(min_rpm, max_rpm), 3),
+            round(generator.uniform(min_rpm, max_rpm), 3),
+            (generator.random() < 0.5, generator.random() < 0.5),
+        ))
+        time += generator.uniform(min_interval, max_interval)
+    return timeline
+
+def encode_motion_profile(timeline):
+    """
+    Convert a timeline of (time, frame_rpm, core_rpm, direction) setpoints into a list of
+    (time, payload, motor_states), where payload is the encoded 0x01 command and motor_states
+    maps each motor id to its speed, direction_cw, enabled, sps and microstepping.
+    direction is a single direction_cw for both motors or a (frame_cw, core_cw) pair.
+    A speed of 0 or None disables that motor.
+    """
+    previous_time = 0
+    rpms = []
+    for time, frame_rpm, core_rpm, _ in timeline:
+        if time < previous_time:
+            raise ValueError(f"Profile times must be non-negative and increasing, got {time} after {previous_time}")
+        previous_time = time
+        rpms.extend((frame_rpm or 0, core_rpm or 0))
+    # Plan all enabled speeds in one batch
+    moving = [rpm for rpm in rpms if rpm > 0]
+    plans = iter(calculate_motor_speeds(moving))
+
+    steps = []
+    for index, (time, _, _, direction) in enumerate(timeline):
+        directions = direction if isinstance(direction, (tuple, list)) else (direction, direction)
+        payload = b""
+        motor_states = {}
+        for motor_id, direction_cw in zip((1, 2), directions):
+            rpm = rpms[2 * index + motor_id - 1]
+            enabled = rpm > 0
+            sps, microstepping = next(plans) if enabled else (0, 1)
+            payload += encode_motor_state(enabled, sps, microstepping, direction_cw)
+            motor_states[motor_id] = {
+                "speed": rpm, "direction_cw": bool(direction_cw), "enabled": enabled, "sps": sps, "microstepping": microstepping
+            }
+        steps.append((time, payload, motor_states))
+    return steps
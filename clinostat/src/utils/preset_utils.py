@@ -0,0 +1,227 @@
+import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+from src.utils.general_utils import load_dynamic_config, save_dynamic_config
+from src.utils.framing_utils import calculate_crc16
+from src.utils.config_utils import load_static_config
+from src.utils.lighting_utils import (
+    LED_COMMAND_RECORD, get_LED_commands, compact_LED_commands, compact_led_segments, led_command_to_segment,
+    led_segment_to_command, pack_led_segments
+)
+
+# Binary preset library: a header with the magic and preset count, then for every preset the length
+# of its UTF-8 name, the name, the segment count and its 7-byte segments, and a CRC16 of everything before it
+PRESET_LIBRARY_PATH = "/home/pi/Documents/clinostat/config/led_presets.bin"
+PRESET_LIBRARY_MAGIC = b"LEDP"
+PRESET_LIBRARY_HEADER = struct.Struct(">4sH")
+PRESET_NAME_LENGTH = struct.Struct(">B")
+PRESET_SEGMENT_COUNT = struct.Struct(">H")
+PRESET_LIBRARY_CRC = struct.Struct(">H")
+
+# Presets stored in the dynamic configuration before the library existed
+LEGACY_PRESET_KEY = re.compile(r"preset_\d+$")
+
+def encode_presets(presets):
+    """
+    Encode a dictionary of preset names and segment lists in the library format.
+    """
+    data = bytearray(PRESET_LIBRARY_HEADER.pack(PRESET_LIBRARY_MAGIC, len(presets)))
+    for name, segments in presets.items():
+        encoded_name = name.encode("utf-8")
+        data += PRESET_NAME_LENGTH.pack(len(encoded_name)) + encoded_name
+        data += PRESET_SEGMENT_COUNT.pack(len(segments))
+        for segment in segments:
+            data += LED_COMMAND_RECORD.pack(*segment)
+    data += PRESET_LIBRARY_CRC.pack(calculate_crc16(data))
+    return bytes(data)
+
+def decode_presets(data):
+    """
+    Decode the library format into a dictionary of preset names and segment tuples.
+    """
+    if len(data) < PRESET_LIBRARY_HEADER.size + PRESET_LIBRARY_CRC.size:
+        raise ValueError("Preset library is truncated")
+    body, (crc,) = data[:-PRESET_LIBRARY_CRC.size], PRESET_LIBRARY_CRC.unpack_from(data, len(data) - PRESET_LIBRARY_CRC.size)
+    if crc != calculate_crc16(body):
+        raise ValueError("Preset library CRC mismatch")
+    magic, count = PRESET_LIBRARY_HEADER.unpack_from(body)
+    if magic != PRESET_LIBRARY_MAGIC:
+        raise ValueError("Not a preset library")
+    presets = {}
+    offset = PRESET_LIBRARY_HEADER.size
+    for _ in range(count):
+        (name_length,) = PRESET_NAME_LENGTH.unpack_from(body, offset)
+        offset += PRESET_NAME_LENGTH.size
+        name = body[offset:offset + name_length].decode("utf-8")
+        offset += name_length
+        (segment_count,) = PRESET_SEGMENT_COUNT.unpack_from(body, offset)
+        offset += PRESET_SEGMENT_COUNT.size
+        presets[name] = tuple(
+            LED_COMMAND_RECORD.unpack_from(body, offset + i * LED_COMMAND_RECORD.size) for i in range(segment_count)
+        )
+        offset += segment_count * LED_COMMAND_RECORD.size
+    return presets
+
+class PresetLibrary:
+    """
+    Named LED presets, held in memory as compacted segments and stored in a compact binary file.
+    The 0x06 payloads that take the strip from a given state to a preset are cached in an LRU cache,
+    so switching between presets that were shown before needs no encoding or file access.
+    """
+    def __init__(self, path, cache_size=16):
+        self.path = path
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.presets = {}
+        self.load_error = None  # Set if the file could not be read and was set aside
+        self.cache = OrderedDict()  # (name, framebuffer snapshot) -> (changed segments, payloads)
+
+    def read_file(self):
+        """
+        Load the presets from the file. Return False if it does not exist.
+        A file that cannot be decoded is renamed to *.corrupt, so the next write does not replace it,
+        and the library starts empty with the reason in load_error.
+        """
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return False
+        try:
+            presets = decode_presets(data)
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            corrupt_path = f"{self.path}.corrupt"
+            os.replace(self.path, corrupt_path)
+            self.load_error = f"The LED preset library could not be read ({e}). It was moved to {corrupt_path} and the presets start empty."
+            print(f"Error reading preset library {self.path}: {e}. Moved to {corrupt_path}")
+            presets = {}
+        with self.lock:
+            self.presets = presets
+            self.cache.clear()
+        return True
+
+    def write_file(self):
+        with self.lock:
+            data = encode_presets(self.presets)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+
+    def names(self):
+        with self.lock:
+            return sorted(self.presets)
+
+    def get_segments(self, name):
+        """
+        Return the preset's compacted segments, or None if there is no such preset.
+        """
+        with self.lock:
+            return self.presets.get(name)
+
+    def get_commands(self, name):
+        """
+        Return the preset as LED command dictionaries, or None if there is no such preset.
+        """
+        with self.lock:
+            segments = self.presets.get(name)
+        if segments is None:
+            return None
+        return [led_segment_to_command(segment) for segment in segments]
+
+    def save(self, name, commands):
+        """
+        Store the LED commands as a preset, compacted, and write the library.
+        """
+        self.update({name: commands})
+
+    def update(self, presets):
+        """
+        Store several presets, given as a dictionary of names and LED commands, with one write.
+        """
+        for name in presets:
+            if len(name.encode("utf-8")) > 255:
+                raise ValueError(f"Preset name is too long: {name}")
+        with self.lock:
+            for name, commands in presets.items():
+                self.presets[name] = tuple(
+                    tuple(segment) for segment in compact_led_segments([led_command_to_segment(command) for command in commands])
+                )
+                self.discard_cached(name)
+        self.write_file()
+
+    def delete(self, name):
+        with self.lock:
+            if self.presets.pop(name, None) is None:
+                return
+            self.discard_cached(name)
+        self.write_file()
+
+    def discard_cached(self, name):
+        for key in [key for key in self.cache if key[0] == name]:
+            del self.cache[key]
+
+    def transition(self, name, framebuffer):
+        """
+        Return (changed segments, 0x06 payloads) that take the strip from the state in the framebuffer
+        to the preset, or None if there is no such preset.
+        """
+        key = (name, framebuffer.snapshot())
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            segments = self.presets.get(name)
+        if segments is None:
+            return None
+
+        changes = framebuffer.diff(segments)
+        frames = (changes, [bytes(payload) for payload in pack_led_segments(changes)] if changes else [])
+        with self.lock:
+            self.cache[key] = frames
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return frames
+
+def save_LED_preset(preset_name):
+    """
+    Save the current series of lighting commands as a preset.
+    """
+    commands = compact_LED_commands(get_LED_commands())
+    if commands:
+        get_preset_library().save(preset_name, commands)
+        print(f"Saved preset: {preset_name}")
+
+def take_legacy_presets(config):
+    """
+    Remove presets stored under preset_<number> keys from a configuration dictionary and return them.
+    Empty presets are dropped.
+    """
+    presets = {}
+    for key in [key for key in config if LEGACY_PRESET_KEY.match(key)]:
+        commands = config.pop(key)
+        if isinstance(commands, list) and commands:
+            presets[key] = commands
+    return presets
+
+_preset_library = None
+_preset_library_lock = threading.Lock()
+
+def get_preset_library():
+    """
+    Return the preset library, moving presets from the dynamic configuration into it on first use.
+    """
+    global _preset_library
+    with _preset_library_lock:
+        if _preset_library is None:
+            library = PresetLibrary(PRESET_LIBRARY_PATH, load_static_config().led_preset_cache_size)
+            if not library.read_file():
+                config = load_dynamic_config()
+                library.update(take_legacy_presets(config))
+                save_dynamic_config(config)
+            _preset_library = library
+        return _preset_library
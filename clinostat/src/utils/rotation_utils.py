@@ -0,0 +1,115 @@
+import math
+from collections import deque
+
+RAD_PER_SECOND_TO_RPM = 60 / (2 * math.pi)
+
+class RotationRateEstimator:
+    """
+    Estimate the frame and core rotation rates from gyro samples of a sensor mounted on the core.
+
+    The sensor turns with the core about core_axis, so that axis reads the core rate directly,
+    while the frame rate appears in the other two axes as a vector of constant length that rotates
+    at the core rate. The frame rate is the length of that vector and the core rate is also tracked
+    from its phase, which does not depend on the gyro bias of the core axis.
+
+    Sums over a sliding time window are updated as samples arrive and leave, so the cost per sample is constant.
+    """
+    def __init__(self, window=10.0, core_axis=1):
+        self.window = window
+        self.core_axis = core_axis
+        self.frame_axes = tuple(axis for axis in range(3) if axis != core_axis)
+        self.reset()
+
+    def reset(self):
+        # Each entry is (timestamp, time step, core rate, frame rate, phase change)
+        self.samples = deque()
+        self.core_sum = 0.0
+        self.frame_sum = 0.0
+        self.phase_sum = 0.0
+        self.phase_time = 0.0
+        self.previous_time = None
+        self.previous_phase = None
+
+    def add_sample(self, timestamp, gyro):
+        """
+        Add one gyro sample in rad/s taken at timestamp seconds.
+        """
+        core_rate = gyro[self.core_axis]
+        first, second = gyro[self.frame_axes[0]], gyro[self.frame_axes[1]]
+        frame_rate = math.hypot(first, second)
+        phase = math.atan2(second, first)
+
+        time_step = 0.0
+        phase_change = 0.0
+        if self.previous_time is not None and timestamp > self.previous_time:
+            time_step = timestamp - self.previous_time
+            # Wrap to [-pi, pi), assuming the core turns less than half a turn between samples
+            phase_change = (phase - self.previous_phase + math.pi) % (2 * math.pi) - math.pi
+        self.previous_time = timestamp
+        self.previous_phase = phase
+
+        self.samples.append((timestamp, time_step, core_rate, frame_rate, phase_change))
+        self.core_sum += core_rate
+        self.frame_sum += frame_rate
+        self.phase_sum += phase_change
+        self.phase_time += time_step
+
+        while self.samples and self.samples[0][0] < timestamp - self.window:
+            _, old_step, old_core, old_frame, old_phase = self.samples.popleft()
+            self.core_sum -= old_core
+            self.frame_sum -= old_frame
+            self.phase_sum -= old_phase
+            self.phase_time -= old_step
+
+    def add_samples(self, timestamps, gyro_samples):
+        """
+        Add a block of samples.
+        """
+        for timestamp, gyro in zip(timestamps, gyro_samples):
+            self.add_sample(timestamp, gyro)
+
+    def estimate(self):
+        """
+        Return the measured rates in RPM over the window as a dictionary with frame_rpm, core_rpm
+        (from the core axis, signed) and core_phase_rpm (from the phase of the frame vector, signed),
+        or None before any samples have been added.
+        """
+        count = len(self.samples)
+        if not count:
+            return None
+        return {
+            "frame_rpm": self.frame_sum / count * RAD_PER_SECOND_TO_RPM,
+            "core_rpm": self.core_sum / count * RAD_PER_SECOND_TO_RPM,
+            "core_phase_rpm": self.phase_sum / self.phase_time * RAD_PER_SECOND_TO_RPM if self.phase_time > 0 else None,
+            "window_samples": count,
+        }
+
+def commanded_rpm(motor_state, motor_steps, gear_ratio):
+    """
+    Return the speed in RPM a motor is commanded to run at, from its sps and microstepping, or 0 if it is disabled.
+    """
+    if not motor_state["enabled"] or not motor_state["sps"]:
+        return 0.0
+    return motor_state["sps"] * 60 / (motor_steps * gear_ratio * motor_state["microstepping"])
+
+def compare_with_commanded(estimate, motor_states, motor_steps, gear_ratio):
+    """
+    Compare measured rates with the commanded motor states and return, for "frame" and "core",
+    the commanded and measured RPM, the measured sps at the commanded microstepping and the drift
+    in RPM and percent. Directions are not compared, as they depend on how the sensor is mounted.
+    """
+    report = {}
+    for name, motor_id, measured in (("frame", 1, estimate["frame_rpm"]), ("core", 2, estimate["core_rpm"])):
+        state = motor_states[motor_id]
+        commanded = commanded_rpm(state, motor_steps, gear_ratio)
+        measured = abs(measured)
+        drift = measured - commanded
+        report[name] = {
+            "commanded_rpm": commanded,
+            "measured_rpm": measured,
+            "commanded_sps": state["sps"] if state["enabled"] else 0,
+            "measured_sps": measured * motor_steps * gear_ratio * state["microstepping"] / 60,
+            "drift_rpm": drift,
+            "drift_percent": drift / commanded * 100 if commanded else None,
+        }
+    return report
@@ -1,8 +1,10 @@
-from src.utils.general_utils import load_dynamic_config, update_runtime_state_from_config, check_storage
+import threading
+from PyQt5.QtWidgets import QMessageBox
+from src.utils.general_utils import load_static_config, load_dynamic_config, update_runtime_state_from_config, check_storage
 import src.ui.updater.general_ui_updater as general_ui_updater
-from src.utils.comms_utils import communication  # Import the communication instance
-from src.utils.lighting_utils import clear_LED_commands  # Correct import
-from src.utils.comms_utils import calculate_crc16  # Import the calculate_crc16 function
+from src.utils.comms_utils import get_communication
+from src.utils.lighting_utils import clear_LED_commands, get_led_framebuffer
+from src.utils.preset_utils import get_preset_library
 
 styles = {"color": "r", "font-size": "15px"}
 
@@ -33,20 +35,36 @@ def initialize_ui(main_window):
         print("Error: version.txt file not found.")
         main_window.setWindowTitle("Clinostat Control Center vUnknown")
 
-def initialize_hardware():
+def check_preset_library(main_window):
+    """
+    Load the LED preset library and warn the user if its file could not be read.
+    """
+    library = get_preset_library()
+    if library.load_error:
+        QMessageBox.warning(main_window, "LED Presets", library.load_error)
+
+def initialize_hardware(main_window):
     """
     Initialize hardware components.
     """
+    communication = get_communication()  # Opens the I2C bus and the UART
+    communication.main_window = main_window  # Report I2C errors to the UI
     # Send reset command to Arduino
     communication.send_i2c_command(0x00, [])
-    clear_LED_commands()
+    get_led_framebuffer().invalidate()  # The reset reboots the Arduino and clears the strip
 
     # Send handshake message
-    handshake_message = "HANDSHAKE"
-    crc = calculate_crc16(handshake_message.encode('utf-8'))
-    handshake_message_with_crc = f"{handshake_message},CRC={crc:04X}"
-    communication.send_uart_data(handshake_message_with_crc)
-    print(f"Sent UART handshake message: {handshake_message_with_crc}")
+    communication.send_uart_message("HANDSHAKE")
+    print("Sent UART handshake message")
+
+    # Switch the UART to binary framing at a higher baud rate if the peer supports it
+    static_config = load_static_config()
+    if static_config.uart_binary_mode:
+        threading.Thread(
+            target=communication.negotiate_binary_mode,
+            args=(static_config.uart_binary_baudrate,),
+            daemon=True
+        ).start()
 
 def startup(main_window):
     """
@@ -55,7 +73,11 @@ def startup(main_window):
     
     initialize_runtime_state()
     initialize_ui(main_window)
-    initialize_hardware()
+    clear_LED_commands()  # The reset clears the strip, keep the dynamic config I/O on this thread
+    # Bring the hardware up in the background while the rest of the window is set up
+    hardware_thread = threading.Thread(target=initialize_hardware, args=(main_window,), name="hardware_init", daemon=True)
+    hardware_thread.start()
     general_ui_updater.initialize_graphs(main_window)
     check_storage(main_window)
+    check_preset_library(main_window)
     # Add any other startup tasks here
\ No newline at end of file
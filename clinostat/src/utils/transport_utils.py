@@ -0,0 +1,382 @@
+import os
+import time
+import random
+import queue
+import threading
+from src.utils.framing_utils import (
+    START_BYTE, PACKET_MAX_SIZE, NUM_LEDS, UART_FRAME_TEXT, I2C_ERROR_NONE, I2C_ERROR_UNKNOWN_COMMAND, I2C_ERROR_MESSAGES,
+    calculate_crc16, build_packet, build_uart_line, parse_uart_line, encode_i2c_status, FrameParser
+)
+
+class SMBusTransport:
+    """
+    I2C transport writing packets to the Arduino through smbus2.
+    """
+    def __init__(self, bus_id=1):
+        import smbus2
+        self.i2c_msg = smbus2.i2c_msg
+        self.bus = smbus2.SMBus(bus_id)
+
+    def write(self, address, packet):
+        self.bus.i2c_rdwr(self.i2c_msg.write(address, packet))
+
+    def write_read(self, address, packet, read_length):
+        """
+        Write a packet and read the reply in one combined transaction (repeated start).
+        """
+        write = self.i2c_msg.write(address, packet)
+        read = self.i2c_msg.read(address, read_length)
+        self.bus.i2c_rdwr(write, read)
+        return bytes(read)
+
+    def read(self, address, read_length):
+        read = self.i2c_msg.read(address, read_length)
+        self.bus.i2c_rdwr(read)
+        return bytes(read)
+
+    def close(self):
+        self.bus.close()
+
+class SerialTransport:
+    """
+    UART transport using pyserial.
+    """
+    def __init__(self, port, baudrate, timeout):
+        import serial
+        self.serial_port = serial.Serial(port=port, baudrate=baudrate, timeout=timeout)
+
+    def write(self, data):
+        self.serial_port.write(data)
+
+    def readline(self):
+        return self.serial_port.readline()
+
+    def read_available(self):
+        """
+        Return every byte waiting in the receive buffer, blocking up to the timeout for the first one when idle.
+        """
+        return self.serial_port.read(self.serial_port.in_waiting or 1)
+
+    def set_baudrate(self, baudrate):
+        self.serial_port.flush()  # Finish sending at the old rate first
+        self.serial_port.baudrate = baudrate
+
+    def close(self):
+        self.serial_port.close()
+
+class LatencyModel:
+    """
+    Timing model for the simulated link.
+    Transfer times follow the bus clock, processing times are per command in seconds.
+    time_scale multiplies every modelled delay before sleeping (0 disables sleeping).
+    """
+    DEFAULT_PROCESSING_TIMES = {
+        0x00: 1.5,     # Reboot plus the startup rainbow
+        0x01: 0.002,   # Two TMC2208 register writes over UART
+        0x02: 0.004,   # Pixel update plus strip.show() for 130 RGBW LEDs
+        0x03: 0.0002,  # Pixel update only
+        0x04: 0.004,   # strip.show()
+        0x05: 0.0,     # Plus the requested buzzer duration
+        0x06: 0.0006,  # Up to three pixel updates, plus strip.show() if flagged
+    }
+
+    def __init__(self, i2c_clock_hz=100000, uart_baudrate=9600, processing_times=None, time_scale=1.0):
+        self.i2c_clock_hz = i2c_clock_hz
+        self.uart_baudrate = uart_baudrate
+        self.processing_times = dict(self.DEFAULT_PROCESSING_TIMES)
+        if processing_times:
+            self.processing_times.update(processing_times)
+        self.time_scale = time_scale
+
+    def i2c_transfer_time(self, byte_count):
+        # Address byte plus data, 9 clocks per byte including ACK
+        return (byte_count + 1) * 9 / self.i2c_clock_hz
+
+    def uart_transfer_time(self, byte_count):
+        # 8N1 framing, 10 bits per byte
+        return byte_count * 10 / self.uart_baudrate
+
+    def processing_time(self, command, data):
+        processing = self.processing_times.get(command, 0.0)
+        if command == 0x05 and data:
+            processing += data[0] / 1000
+        elif command == 0x06 and data and data[0] & 0x01:
+            processing += self.processing_times[0x04]
+        return processing
+
+    def wait(self, seconds):
+        if self.time_scale > 0 and seconds > 0:
+            time.sleep(seconds * self.time_scale)
+
+class VirtualArduino:
+    """
+    In-process model of the Arduino firmware.
+    Packets are validated like receivePacket and the resulting motor and LED state is recorded.
+    """
+    COMMANDS = (0x00, 0x01, 0x02, 0x03, 0x04, 0x05, 0x06)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.errors = []
+        self.command_counts = {}
+        self.status_sequence = 0
+        self.status_error = I2C_ERROR_NONE
+        self.reset()
+
+    def reset(self):
+        self.motor_states = {
+            "frame": {"enabled": False, "sps": 533.333, "microstepping": 16, "direction_cw": True},
+            "core": {"enabled": False, "sps": 533.333, "microstepping": 16, "direction_cw": True},
+        }
+        self.framebuffer = [(0, 0, 0, 0)] * NUM_LEDS  # (red, green, blue, white) per LED
+        self.displayed_frame = list(self.framebuffer)
+        self.brightness = 255
+        self.buzzer_count = 0
+
+    def receive_packet(self, packet):
+        """
+        Validate a packet exactly like receivePacket in the firmware.
+        Return (command, data) for a valid packet or None after recording the error.
+        """
+        byte_count = len(packet)
+        if byte_count < 5:
+            return self.record_error(1)
+        if byte_count > PACKET_MAX_SIZE:
+            return self.record_error(2)
+        if packet[0] != START_BYTE:
+            return self.record_error(3)
+        length = packet[1]
+        if length != byte_count - 4:
+            return self.record_error(4)
+        computed_crc = calculate_crc16(packet[:byte_count - 2])
+        received_crc = (packet[byte_count - 2] << 8) | packet[byte_count - 1]
+        if computed_crc != received_crc:
+            return self.record_error(5)
+        return packet[2], list(packet[3:3 + length - 1])
+
+    def record_error(self, error_code):
+        with self.lock:
+            self.errors.append(I2C_ERROR_MESSAGES[error_code])
+            self.update_status(error_code)
+        return None
+
+    def update_status(self, error_code):
+        self.status_sequence = (self.status_sequence + 1) & 0x0F
+        self.status_error = error_code
+
+    def process_command(self, command, data):
+        with self.lock:
+            self.command_counts[command] = self.command_counts.get(command, 0) + 1
+            if command == 0x00:
+                self.reset()
+                self.status_sequence = 0
+                self.status_error = I2C_ERROR_NONE
+                return
+            self.update_status(I2C_ERROR_NONE if command in self.COMMANDS else I2C_ERROR_UNKNOWN_COMMAND)
+            if command == 0x01:
+                self.set_motor_state_and_speed(data)
+            elif command == 0x02:
+                self.set_led_colors(data)
+                self.displayed_frame = list(self.framebuffer)
+            elif command == 0x03:
+                self.set_led_colors(data)
+            elif command == 0x04:
+                self.displayed_frame = list(self.framebuffer)
+            elif command == 0x05:
+                if data:
+                    self.buzzer_count += 1
+            elif command == 0x06:
+                self.set_led_segments(data)
+
+    def set_motor_state_and_speed(self, data):
+        if len(data) < 12:
+            return
+        for name, offset in (("frame", 0), ("core", 6)):
+            sps_raw = (data[offset + 1] << 16) | (data[offset + 2] << 8) | data[offset + 3]
+            self.motor_states[name] = {
+                "enabled": bool(data[offset]),
+                "sps": sps_raw / 1000.0,
+                "microstepping": 1 << data[offset + 4],
+                "direction_cw": bool(data[offset + 5]),
+            }
+
+    def set_led_colors(self, data):
+        if len(data) < 7:
+            return
+        start = (data[0] - 1) & 0xFF
+        end = (data[1] - 1) & 0xFF
+        color = (data[2], data[3], data[4], data[5])
+        for i in range(start, min(end, NUM_LEDS - 1) + 1):
+            self.framebuffer[i] = color
+        self.brightness = data[6]
+
+    def set_led_segments(self, data):
+        if len(data) < 1:
+            return
+        for offset in range(1, len(data) - 6, 7):
+            self.set_led_colors(data[offset:offset + 7])
+        if data[0] & 0x01:
+            self.displayed_frame = list(self.framebuffer)
+
+class SimulatedI2CTransport:
+    """
+    I2C transport delivering packets to a VirtualArduino with modelled bus and processing latency.
+    The Arduino handles a packet inside the receive interrupt, so a write waits for the previous one to finish.
+    error_rate is the probability that a packet is corrupted on the bus, to exercise retries.
+    """
+    def __init__(self, arduino=None, latency_model=None, error_rate=0.0):
+        self.arduino = arduino or VirtualArduino()
+        self.latency_model = latency_model or LatencyModel()
+        self.error_rate = error_rate
+        self.busy_until = 0.0
+        self.modelled_bus_time = 0.0
+        self.packets_written = 0
+        self.bytes_written = 0
+
+    def write(self, address, packet):
+        now = time.monotonic()
+        if self.busy_until > now:
+            time.sleep(self.busy_until - now)  # busy_until is already scaled
+
+        transfer_time = self.latency_model.i2c_transfer_time(len(packet))
+        self.latency_model.wait(transfer_time)
+
+        processing_time = 0.0
+        packet = list(packet)
+        if self.error_rate and random.random() < self.error_rate:
+            packet[-1] ^= 0xFF
+        received = self.arduino.receive_packet(packet)
+        if received is not None:
+            command, data = received
+            self.arduino.process_command(command, data)
+            processing_time = self.latency_model.processing_time(command, data)
+
+        self.busy_until = time.monotonic() + processing_time * self.latency_model.time_scale
+        self.modelled_bus_time += transfer_time + processing_time
+        self.packets_written += 1
+        self.bytes_written += len(packet)
+
+    def write_read(self, address, packet, read_length):
+        self.write(address, packet)
+        return self.read(address, read_length)
+
+    def read(self, address, read_length):
+        self.latency_model.wait(self.latency_model.i2c_transfer_time(read_length))
+        busy = self.busy_until > time.monotonic()
+        status = encode_i2c_status(self.arduino.status_sequence, self.arduino.status_error, busy)
+        return bytes([status] * read_length)
+
+    def close(self):
+        pass
+
+class SimulatedUARTTransport:
+    """
+    UART transport answering the handshake and binary mode negotiation like the controller peer.
+    Messages queued with inject_line or inject_frame are returned by readline, which times out like pyserial.
+    """
+    def __init__(self, latency_model=None, timeout=1, handshake_ssid=None, handshake_password="", binary_supported=True):
+        self.latency_model = latency_model or LatencyModel()
+        self.timeout = timeout
+        self.handshake_ssid = handshake_ssid
+        self.handshake_password = handshake_password
+        self.binary_supported = binary_supported
+        self.binary_mode = False
+        self.frame_parser = FrameParser()
+        self.incoming = queue.Queue()
+        self.written = []
+
+    def write(self, data):
+        self.latency_model.wait(self.latency_model.uart_transfer_time(len(data)))
+        self.written.append(bytes(data))
+        if self.binary_mode:
+            messages = [payload.decode('utf-8') for frame_type, payload in self.frame_parser.feed(data) if frame_type == UART_FRAME_TEXT]
+        else:
+            # Text messages are written without a line ending, one per write
+            messages = [message for message, crc_valid in map(parse_uart_line, bytes(data).splitlines()) if crc_valid]
+        for message in messages:
+            self.handle_message(message)
+
+    def handle_message(self, message):
+        fields = message.split(',')
+        if fields[0] == "HANDSHAKE":
+            self.respond_to_handshake()
+        elif fields[0] == "UART_MODE" and self.binary_supported:
+            parameters = dict(field.split('=', 1) for field in fields[1:])
+            if parameters.get('BINARY') == "1":
+                self.send_message(f"UART_MODE_ACK,BINARY=1,BAUD={parameters.get('BAUD', self.latency_model.uart_baudrate)}")
+                self.binary_mode = True
+            elif self.binary_mode:
+                self.binary_mode = False  # The revert to the text protocol is not answered
+            self.latency_model.uart_baudrate = int(parameters.get('BAUD', self.latency_model.uart_baudrate))
+
+    def respond_to_handshake(self):
+        ssid = self.handshake_ssid
+        if ssid is None:
+            from src.utils.core_utils import get_current_ssid
+            try:
+                ssid = get_current_ssid()  # Answer with the current network so no Wi-Fi change is made
+            except OSError:
+                ssid = None  # iwgetid is not available off the Pi
+        if ssid is None:
+            print("Simulator: no SSID available, handshake not answered.")
+            return
+        self.send_message(f"HANDSHAKE_RESPONSE,SSID={ssid},PASSWORD={self.handshake_password}")
+
+    def send_message(self, message):
+        if self.binary_mode:
+            self.inject_frame(UART_FRAME_TEXT, message.encode('utf-8'))
+        else:
+            self.inject_line(build_uart_line(message))
+
+    def inject_line(self, line):
+        data = line.encode('utf-8') + b"\n"
+        self.latency_model.wait(self.latency_model.uart_transfer_time(len(data)))
+        self.incoming.put(data)
+
+    def inject_frame(self, frame_type, payload):
+        data = build_packet(frame_type, payload)
+        self.latency_model.wait(self.latency_model.uart_transfer_time(len(data)))
+        self.incoming.put(data)
+
+    def readline(self):
+        try:
+            return self.incoming.get(timeout=self.timeout)
+        except queue.Empty:
+            return b""
+
+    def read_available(self):
+        chunks = [self.readline()]
+        while not self.incoming.empty():
+            chunks.append(self.incoming.get_nowait())
+        return b"".join(chunks)
+
+    def set_baudrate(self, baudrate):
+        self.latency_model.uart_baudrate = baudrate
+
+    def close(self):
+        pass
+
+def create_transports(static_config, bus_id=1, backend=None):
+    """
+    Create the (I2C, UART) transport pair.
+    The backend is taken from the CLINOSTAT_TRANSPORT environment variable, then the transport
+    static config value, and is either "hardware" (default) or "simulator".
+    """
+    if backend is None:
+        backend = os.environ.get("CLINOSTAT_TRANSPORT", static_config.transport)
+
+    if backend == "simulator":
+        latency_model = LatencyModel(
+            i2c_clock_hz=static_config.simulator_latency.i2c_clock_hz,
+            uart_baudrate=static_config.baudrate,
+            time_scale=static_config.simulator_latency.time_scale,
+        )
+        i2c_transport = SimulatedI2CTransport(latency_model=latency_model)
+        uart_transport = SimulatedUARTTransport(latency_model=latency_model, timeout=static_config.timeout)
+    elif backend == "hardware":
+        i2c_transport = SMBusTransport(bus_id)
+        uart_transport = SerialTransport(static_config.uart_port, static_config.baudrate, static_config.timeout)
+    else:
+        raise ValueError(f"Unknown transport backend: {backend}")
+
+    return i2c_transport, uart_transport